@@ -1,14 +1,130 @@
 from pathlib import Path
 import argparse
 import sys
-import sqlite3
+
+import pandas as pd
 
 from src.load_file import load_file
-from src.analyze import analyze_data
-from src.present_data import present_analysis_tables
+from src.analysis import Analysis
 from src.export_tables import export_latex_tables
-from src.db.get_db_info import add_db_to_df
-from src.analyze_correlations import analyze_correlations
+from src.analyze_correlations import present_correlations
+from src.agreement import load_rater_workbooks, analyze_agreement
+from src.power import simulate_metric_power, simulate_correlation_power
+from src.server import serve
+from src.notes_index import (
+    build_notes_index,
+    index_is_current,
+    load_index,
+    save_index,
+    search_notes,
+)
+
+def run_search(args, file_path, output_dir):
+    """
+    Query the evaluator notes, (re)building the on-disk index if needed.
+    """
+    index_path = args.index_path or output_dir / "notes_index.json"
+
+    index = None
+    if index_path.is_file() and not args.rebuild:
+        index = load_index(index_path)
+        if not index_is_current(index, file_path):
+            index = None
+
+    if index is None:
+        try:
+            df = load_file(file_path)
+        except Exception as e:
+            print(f"Error loading file {file_path}: {e}")
+            sys.exit(1)
+        index = build_notes_index(df, source=file_path)
+        save_index(index, index_path)
+
+    try:
+        hits = search_notes(
+            index,
+            args.query,
+            category=args.category,
+            context_level=args.context_level,
+        )
+    except ValueError as e:
+        print(f"Error in query: {e}")
+        sys.exit(1)
+
+    if hits.empty:
+        print("No matching notes.")
+    else:
+        print(hits.to_string(index=False))
+
+def run_agreement(args, file_path):
+    """
+    Compare the ratings in the main workbook with those of other evaluators.
+    """
+    rater_files = [file_path] + args.rater_files
+    for rater_file in args.rater_files:
+        if not rater_file.is_file():
+            print(f"Error: Rater file {rater_file} does not exist.")
+            sys.exit(1)
+
+    try:
+        frames = load_rater_workbooks(rater_files)
+    except Exception as e:
+        print(f"Error loading rater files: {e}")
+        sys.exit(1)
+
+    agreement = analyze_agreement(frames, n_boot=args.bootstrap, seed=args.seed)
+
+    columns = ['metric', 'n_items', 'n_raters']
+    for name in ['cohen_kappa', 'weighted_kappa', 'fleiss_kappa', 'krippendorff_alpha']:
+        agreement[name] = [
+            '-' if pd.isna(value) else f"{value:.3f} [{lower:.3f}, {upper:.3f}]"
+            for value, lower, upper in zip(agreement[name], agreement[f'{name}_ci_lower'], agreement[f'{name}_ci_upper'])
+        ]
+        columns.append(name)
+    print(agreement[columns].to_string(index=False))
+
+def run_plan(args, file_path):
+    """
+    Print Monte Carlo power curves for the next evaluation round.
+    """
+    try:
+        df = load_file(file_path)
+    except Exception as e:
+        print(f"Error loading file {file_path}: {e}")
+        sys.exit(1)
+
+    try:
+        power = simulate_metric_power(
+            df,
+            args.metric,
+            effects=args.effects,
+            n_scenarios=args.scenarios,
+            responses_per_scenario=args.responses_per_scenario,
+            actions_per_response=args.actions_per_response,
+            n_sims=args.sims,
+            alpha=args.alpha,
+            seed=args.seed,
+        )
+        print(power.to_string(index=False))
+
+        if args.correlate:
+            column1, column2 = args.correlate
+            correlation_power = simulate_correlation_power(
+                df,
+                column1,
+                column2,
+                correlations=args.correlations,
+                sample_sizes=args.pairs,
+                level=args.correlation_level,
+                n_sims=args.sims,
+                alpha=args.alpha,
+                seed=args.seed,
+            )
+            print()
+            print(correlation_power.to_string(index=False))
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
 def main():
 
@@ -27,6 +143,117 @@ def main():
         "-d", "--db_file", type=Path, default=Path("data/completed.db"),
         help="Path to the SQLite database file (default: completed.db)"
     )
+    parser.add_argument(
+        "--engine", choices=["pandas", "sql"], default="pandas",
+        help="Compute the grouped metrics in pandas or inside SQLite (default: pandas)"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    search_parser = subparsers.add_parser(
+        "search", help="Search the evaluator notes (terms, \"phrases\", AND/OR/NOT)"
+    )
+    search_parser.add_argument("query", help="Query string")
+    search_parser.add_argument(
+        "-c", "--category", default=None,
+        help="Only return hits from this finding category"
+    )
+    search_parser.add_argument(
+        "-l", "--context-level", dest="context_level", default=None,
+        help="Only return hits from this context level"
+    )
+    search_parser.add_argument(
+        "-i", "--index", dest="index_path", type=Path, default=None,
+        help="Path to the notes index (default: <output_dir>/notes_index.json)"
+    )
+    search_parser.add_argument(
+        "--rebuild", action="store_true",
+        help="Rebuild the notes index even if it is up to date"
+    )
+
+    agreement_parser = subparsers.add_parser(
+        "agreement", help="Inter-rater agreement between evaluator workbooks"
+    )
+    agreement_parser.add_argument(
+        "rater_files", nargs="+", type=Path,
+        help="Workbooks from the other evaluators, compared with --file"
+    )
+    agreement_parser.add_argument(
+        "-b", "--bootstrap", type=int, default=1000,
+        help="Number of bootstrap resamples for the intervals (default: 1000)"
+    )
+    agreement_parser.add_argument(
+        "--seed", type=int, default=None,
+        help="Seed for the bootstrap resampling"
+    )
+
+    plan_parser = subparsers.add_parser(
+        "plan", help="Power curves for planning the number of scenarios to score"
+    )
+    plan_parser.add_argument(
+        "-m", "--metric", default="usefulness",
+        help="Metric to compare between two groups (default: usefulness)"
+    )
+    plan_parser.add_argument(
+        "-e", "--effects", type=float, nargs="+", required=True,
+        help="Hypothesized differences in the mean (in the rate for Y/N metrics)"
+    )
+    plan_parser.add_argument(
+        "-s", "--scenarios", type=int, nargs="+", default=[5, 10, 20, 40, 80],
+        help="Candidate numbers of scenarios per group (default: 5 10 20 40 80)"
+    )
+    plan_parser.add_argument(
+        "--responses-per-scenario", type=int, default=None,
+        help="Responses scored per scenario (default: observed median)"
+    )
+    plan_parser.add_argument(
+        "--actions-per-response", type=int, default=None,
+        help="Actions scored per response (default: observed median)"
+    )
+    plan_parser.add_argument(
+        "--correlate", nargs=2, metavar=("COLUMN1", "COLUMN2"), default=None,
+        help="Also plan for the correlation between two workbook columns"
+    )
+    plan_parser.add_argument(
+        "--correlations", type=float, nargs="+", default=[0.1, 0.2, 0.3],
+        help="Hypothesized correlations (default: 0.1 0.2 0.3)"
+    )
+    plan_parser.add_argument(
+        "--pairs", type=int, nargs="+", default=[30, 100, 300, 1000],
+        help="Candidate numbers of paired observations (default: 30 100 300 1000)"
+    )
+    plan_parser.add_argument(
+        "--correlation-level", choices=["action", "response", "scenario"], default="action",
+        help="Level at which the correlation is computed (default: action)"
+    )
+    plan_parser.add_argument(
+        "--sims", type=int, default=2000,
+        help="Simulated replicates per design (default: 2000)"
+    )
+    plan_parser.add_argument(
+        "--alpha", type=float, default=0.05,
+        help="Significance level (default: 0.05)"
+    )
+    plan_parser.add_argument(
+        "--seed", type=int, default=None,
+        help="Seed for the simulation"
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve the analysis as a local HTTP/JSON API"
+    )
+    serve_parser.add_argument(
+        "rater_files", nargs="*", type=Path,
+        help="Workbooks from other evaluators, for the /agreement endpoint"
+    )
+    serve_parser.add_argument(
+        "--host", default="127.0.0.1",
+        help="Address to listen on (default: 127.0.0.1)"
+    )
+    serve_parser.add_argument(
+        "-p", "--port", type=int, default=8000,
+        help="Port to listen on (default: 8000)"
+    )
     
     args = parser.parse_args()
 
@@ -47,6 +274,19 @@ def main():
     if not output_dir.is_dir():
         output_dir.mkdir(parents=True, exist_ok=True)
 
+    # The search, agreement and plan commands only need the workbooks
+    if args.command == "search":
+        run_search(args, file_path, output_dir)
+        return
+
+    if args.command == "agreement":
+        run_agreement(args, file_path)
+        return
+
+    if args.command == "plan":
+        run_plan(args, file_path)
+        return
+
     # Check if the database file exists, and if its a .db file
     if not db_file.is_file():
         print(f"Error: Database file {db_file} does not exist.")
@@ -56,31 +296,46 @@ def main():
         print("Error: Database file is not a SQLite (.db) file.")
         sys.exit(1)
 
+    analysis = Analysis(file_path, db_file, engine=args.engine)
+
     # load the file and process it
     try:
-        df = load_file(file_path)
+        analysis.df
     except Exception as e:
         print(f"Error loading file {file_path}: {e}")
         sys.exit(1)
 
-    # analyze the data
-    analysis = analyze_data(df)
-
-    presented_data = present_analysis_tables(analysis)
-
-    export_latex_tables(presented_data, output_dir)
+    # keep the analysis in memory and answer queries
+    if args.command == "serve":
+        rater_frames = None
+        if args.rater_files:
+            try:
+                rater_frames = load_rater_workbooks(args.rater_files)
+            except Exception as e:
+                print(f"Error loading rater files: {e}")
+                sys.exit(1)
+        serve(analysis, host=args.host, port=args.port, rater_frames=rater_frames)
+        analysis.close()
+        return
 
+    # analyze the data
+    export_latex_tables(analysis.presented_tables, output_dir)
 
-    # add database connection and queries
-    conn = sqlite3.connect(db_file)
-    cur = conn.cursor()
+    # variance decomposition and design-effect-adjusted intervals
+    export_latex_tables(analysis.presented_variance_tables, output_dir)
 
-    # add the database information to the DataFrame
-    df = add_db_to_df(cur, df)
+    # check the hand-entered tree values against the message table
+    tree_check = analysis.tree_check
+    mismatches = tree_check[~(tree_check['depth_matches'] & tree_check['branches_matches'])]
+    if not mismatches.empty:
+        print("Warning: sheet tree values differ from the database:")
+        print(mismatches.to_string(index=False))
 
     # analyze correlations
-    print(analyze_correlations(df))
+    print(present_correlations(analysis.correlations))
+
+    analysis.close()
 
 if __name__ == "__main__":
     main()
-    sys.exit(0)
\ No newline at end of file
+    sys.exit(0)
@@ -0,0 +1,326 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .analyze import METRICS, LEVEL_UNIT_COLS, metric_values
+from .load_file import load_file
+
+
+def load_rater_workbooks(file_paths) -> dict:
+    """
+    Load one evaluation workbook per rater.
+
+    Parameters
+    ----------
+    file_paths : list[str or Path]
+        The workbooks, all filled in from the same template.
+
+    Returns
+    -------
+    dict[str, pd.DataFrame]
+        Flattened DataFrames keyed by rater label (the file stem, suffixed
+        with its position if two files share a stem).
+    """
+    stems = [Path(p).stem for p in file_paths]
+    frames = {}
+    for i, (path, stem) in enumerate(zip(file_paths, stems)):
+        label = stem if stems.count(stem) == 1 else f"{stem}_{i + 1}"
+        frames[label] = load_file(path)
+    return frames
+
+
+def align_ratings(frames: dict, metric_col: str, level: str, binary_condition=None) -> pd.DataFrame:
+    """
+    Align one metric across raters on its item keys. Actions are keyed by
+    (scenario, response_id, action_name, occurrence), where occurrence
+    numbers actions with the same name within a response.
+
+    Returns
+    -------
+    pd.DataFrame
+        Items x raters matrix of float ratings, NaN where a rater did not
+        rate an item. Binary metrics are converted to 0/1 with
+        `binary_condition`; a blank cell counts as 0, as in the tables.
+    """
+    keys = LEVEL_UNIT_COLS[level]
+    if level == 'action':
+        # Action names are free text and may repeat within a response, so
+        # actions are also told apart by their position among same-named ones
+        keys = keys + ['occurrence']
+    parts = []
+    for rater, df in frames.items():
+        if level == 'action':
+            df = df.assign(occurrence=df.groupby(LEVEL_UNIT_COLS[level], sort=False).cumcount())
+        part = df[keys + [metric_col]].drop_duplicates(subset=keys)
+        parts.append(part[keys].assign(rater=rater, rating=metric_values(part[metric_col], binary_condition)))
+
+    long = pd.concat(parts, ignore_index=True)
+    long = long[long['rating'].notna()]
+    return long.set_index(keys + ['rater'])['rating'].unstack('rater').reindex(columns=list(frames))
+
+
+def _bootstrap_weights(n_items: int, n_boot: int, rng) -> np.ndarray:
+    """
+    Item multiplicities for `n_boot` bootstrap resamples, as a (n_boot, n_items) matrix.
+    """
+    draws = rng.integers(0, n_items, size=(n_boot, n_items))
+    offsets = (np.arange(n_boot) * n_items)[:, None]
+    return np.bincount((draws + offsets).ravel(), minlength=n_boot * n_items).reshape(n_boot, n_items).astype(float)
+
+
+def _conger_kappa(observed_sum, item_sum, rater_counts, agreement_weights) -> np.ndarray:
+    """
+    Multi-rater (Conger) generalization of Cohen's (weighted) kappa from
+    (weighted) sums over items. Chance agreement uses each rater's own
+    marginal distribution; with two raters this is Cohen's kappa.
+
+    Parameters
+    ----------
+    observed_sum : np.ndarray
+        (B,) sum of per-item weighted pairwise agreement.
+
+    item_sum : np.ndarray
+        (B,) sum of item weights.
+
+    rater_counts : np.ndarray
+        (B, R, K) weighted category counts per rater.
+
+    agreement_weights : np.ndarray
+        (K, K) agreement weights, the identity for unweighted kappa.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = rater_counts / rater_counts.sum(axis=2, keepdims=True)
+        active = ~np.isnan(p[:, :, 0])
+        p = np.nan_to_num(p)
+        n_active = active.sum(axis=1)
+        total = p.sum(axis=1)
+        cross = np.einsum('bk,bl->bkl', total, total) - np.einsum('brk,brl->bkl', p, p)
+        p_e = (cross * agreement_weights).sum(axis=(1, 2)) / (n_active * (n_active - 1))
+        p_o = observed_sum / item_sum
+        return (p_o - p_e) / (1 - p_e)
+
+
+def _fleiss_from_sums(agreement_sum, category_sums, rating_sum, item_sum) -> np.ndarray:
+    """
+    Fleiss' kappa from (weighted) sums over items, generalized to a varying
+    number of raters per item.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_bar = agreement_sum / item_sum
+        p = category_sums / rating_sum[..., None]
+        p_e = (p ** 2).sum(axis=-1)
+        return (p_bar - p_e) / (1 - p_e)
+
+
+def _alpha_from_coincidences(coincidences: np.ndarray, delta: np.ndarray) -> np.ndarray:
+    """
+    Krippendorff's alpha from a stack of flattened KxK coincidence matrices.
+    """
+    K = delta.shape[0]
+    coincidences = coincidences.reshape(-1, K, K)
+    n_c = coincidences.sum(axis=2)
+    n = n_c.sum(axis=1)
+    observed = (coincidences * delta).sum(axis=(1, 2))
+    expected = (n_c[:, :, None] * n_c[:, None, :] * delta).sum(axis=(1, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - (n - 1) * observed / expected
+
+
+def agreement_statistics(
+    ratings: pd.DataFrame,
+    ordinal: bool,
+    n_boot: int=1000,
+    confidence: float=0.95,
+    seed=None,
+) -> dict:
+    """
+    Cohen's, weighted and Fleiss' kappa and Krippendorff's alpha for one
+    items x raters rating matrix, with percentile bootstrap intervals.
+
+    Ratings are encoded once into per-item count, coincidence and per-rater
+    one-hot rows. Every statistic is a function of sums of those rows, so a
+    bootstrap resample is a weighted sum and all resamples are evaluated
+    with a few matrix products. With more than two raters, Cohen's kappa is
+    generalized as Conger's kappa (chance agreement from each rater's own
+    marginals) rather than averaged over rater pairs; `pairwise_kappa`
+    gives the individual pairs.
+
+    Parameters
+    ----------
+    ratings : pd.DataFrame
+        Output of `align_ratings`.
+
+    ordinal : bool
+        Whether the scale is ordered. Ordinal scales get a quadratically
+        weighted kappa and an interval-metric alpha; otherwise the weighted
+        kappa is NaN and alpha uses the nominal metric.
+
+    n_boot : int, default=1000
+        Number of bootstrap resamples of the items. 0 disables the intervals.
+
+    confidence : float, default=0.95
+        Coverage of the bootstrap intervals.
+
+    seed : int, optional
+        Seed for the bootstrap resampling.
+
+    Returns
+    -------
+    dict
+        'n_items', 'n_raters', and for each of 'cohen_kappa',
+        'weighted_kappa', 'fleiss_kappa' and
+        'krippendorff_alpha' the estimate with '_ci_lower' / '_ci_upper'.
+    """
+    values = ratings.to_numpy(dtype=float)
+    categories = np.unique(values[~np.isnan(values)])
+    n_items, n_raters = values.shape
+    K = len(categories)
+
+    result = {'n_items': n_items, 'n_raters': n_raters}
+    names = ['cohen_kappa', 'weighted_kappa', 'fleiss_kappa', 'krippendorff_alpha']
+    if n_items == 0 or n_raters < 2 or K < 2:
+        for name in names:
+            result.update({name: np.nan, f'{name}_ci_lower': np.nan, f'{name}_ci_upper': np.nan})
+        return result
+
+    # Category index per rating, -1 where missing
+    rated = ~np.isnan(values)
+    codes = np.where(rated, np.searchsorted(categories, np.where(rated, values, categories[0])), -1)
+
+    # Disagreement weights
+    nominal = 1.0 - np.eye(K)
+    span = categories[-1] - categories[0]
+    quadratic = ((categories[:, None] - categories[None, :]) / span) ** 2
+
+    # Per-item category counts, restricted to items rated at least twice
+    item_index = np.repeat(np.arange(n_items), n_raters)
+    flat_codes = codes.ravel()
+    valid = flat_codes >= 0
+    counts = np.bincount(item_index[valid] * K + flat_codes[valid], minlength=n_items * K).reshape(n_items, K).astype(float)
+    m = counts.sum(axis=1)
+    pairable = m >= 2
+    counts *= pairable[:, None]
+    m *= pairable
+
+    # Per-item pairwise coincidences; unweighted and weighted agreement follow from them
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coincidences = (counts[:, :, None] * counts[:, None, :] - counts[:, :, None] * np.eye(K)) / (m - 1)[:, None, None]
+    coincidences = np.where(pairable[:, None, None], coincidences, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pair_share = np.where(pairable, 1 / m, 0.0)[:, None]
+    agreement = (coincidences * np.eye(K)).sum(axis=(1, 2))[:, None] * pair_share
+    weighted_agreement = (coincidences * (1 - quadratic)).sum(axis=(1, 2))[:, None] * pair_share
+    coincidences = coincidences.reshape(n_items, K * K)
+
+    # Per-item one-hot ratings of each rater, for the rater marginals
+    rater_onehot = np.zeros((n_items, n_raters * K))
+    rows, raters = np.nonzero((codes >= 0) & pairable[:, None])
+    rater_onehot[rows, raters * K + codes[rows, raters]] = 1.0
+    item_columns = np.hstack([agreement, weighted_agreement, counts, m[:, None], pairable[:, None].astype(float)])
+
+    def statistics(weights):
+        """
+        All four statistics for a (B, n_items) matrix of item weights.
+        """
+        sums = weights @ item_columns
+        agreement_sum, weighted_sum = sums[:, 0], sums[:, 1]
+        category_sums, rating_sum, item_sum = sums[:, 2:2 + K], sums[:, 2 + K], sums[:, 3 + K]
+        rater_counts = (weights @ rater_onehot).reshape(-1, n_raters, K)
+
+        cohen = _conger_kappa(agreement_sum, item_sum, rater_counts, np.eye(K))
+        weighted = (
+            _conger_kappa(weighted_sum, item_sum, rater_counts, 1 - quadratic)
+            if ordinal else np.full(len(weights), np.nan)
+        )
+        fleiss = _fleiss_from_sums(agreement_sum, category_sums, rating_sum, item_sum)
+        alpha = _alpha_from_coincidences(weights @ coincidences, quadratic if ordinal else nominal)
+        return dict(zip(names, [cohen, weighted, fleiss, alpha]))
+
+    with np.errstate(all='ignore'):
+        estimates = statistics(np.ones((1, n_items)))
+        if n_boot > 0:
+            boot = statistics(_bootstrap_weights(n_items, n_boot, np.random.default_rng(seed)))
+
+    tail = (1 - confidence) / 2 * 100
+    for name in names:
+        result[name] = float(estimates[name][0])
+        if n_boot > 0 and not np.all(np.isnan(boot[name])):
+            lower, upper = np.nanpercentile(boot[name], [tail, 100 - tail])
+        else:
+            lower = upper = np.nan
+        result[f'{name}_ci_lower'] = float(lower)
+        result[f'{name}_ci_upper'] = float(upper)
+
+    return result
+
+
+def pairwise_kappa(ratings: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cohen's kappa for every pair of raters, on the items both of them rated.
+
+    All pairwise contingency tables come from one product of the
+    items x (raters * categories) one-hot matrix with itself.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns 'rater1', 'rater2', 'n_items' and 'cohen_kappa'.
+    """
+    values = ratings.to_numpy(dtype=float)
+    categories = np.unique(values[~np.isnan(values)])
+    n_items, n_raters = values.shape
+    K = len(categories)
+
+    rows, raters = np.nonzero(~np.isnan(values))
+    onehot = np.zeros((n_items, n_raters * K))
+    onehot[rows, raters * K + np.searchsorted(categories, values[rows, raters])] = 1.0
+    tables = (onehot.T @ onehot).reshape(n_raters, K, n_raters, K)
+
+    result = []
+    for r in range(n_raters):
+        for s in range(r + 1, n_raters):
+            table = tables[r, :, s, :]
+            n = table.sum()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                p = table / n
+                p_o = np.trace(p)
+                p_e = p.sum(axis=1) @ p.sum(axis=0)
+                kappa = (p_o - p_e) / (1 - p_e)
+            result.append({
+                'rater1': ratings.columns[r],
+                'rater2': ratings.columns[s],
+                'n_items': int(n),
+                'cohen_kappa': float(kappa),
+            })
+    return pd.DataFrame(result, columns=['rater1', 'rater2', 'n_items', 'cohen_kappa'])
+
+
+def analyze_agreement(frames: dict, n_boot: int=1000, confidence: float=0.95, seed=None) -> pd.DataFrame:
+    """
+    Inter-rater agreement for every metric in `METRICS`.
+
+    Metrics without a binary condition and with more than two distinct
+    values are treated as ordinal 0-5 scales.
+
+    Parameters
+    ----------
+    frames : dict[str, pd.DataFrame]
+        Flattened DataFrames keyed by rater, e.g. from `load_rater_workbooks`.
+
+    n_boot, confidence, seed
+        Passed to `agreement_statistics`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per metric with the columns of `agreement_statistics`.
+    """
+    rows = []
+    for metric_col, level, condition, _ in METRICS:
+        ratings = align_ratings(frames, metric_col, level, condition)
+        ordinal = condition is None and ratings.stack().nunique() > 2
+        row = {'metric': metric_col, 'level': level}
+        row.update(agreement_statistics(ratings, ordinal, n_boot=n_boot, confidence=confidence, seed=seed))
+        rows.append(row)
+    return pd.DataFrame(rows)
@@ -0,0 +1,228 @@
+from functools import cached_property
+from pathlib import Path
+import sqlite3
+
+import pandas as pd
+
+from .load_file import load_file
+from .analyze import analyze_data, GROUP_COLS, METRICS
+from .metrics import compute_grouped_metric
+from .present_data import present_analysis_tables, present_variance_tables
+from .analyze_correlations import compute_correlations
+from .db.get_db_info import add_db_to_df
+from .db.text_store import MessageTextStore
+from .db.sql_engine import SqlMetricEngine
+from .db.tree_stats import validate_sheet_tree_values
+from .variance import variance_decomposition, analyze_design_effects
+
+
+class Analysis:
+    """
+    Library entry point for the evaluation analysis.
+
+    Nothing is loaded or computed when the object is created. Each result is
+    computed the first time it is accessed and memoized, so a notebook that
+    only needs one table does not pay for the database enrichment or the
+    correlation analysis.
+
+    Parameters
+    ----------
+    workbook_path : str or Path
+        Path to the evaluation workbook (.xls or .xlsx).
+
+    db_path : str or Path, optional
+        Path to the SQLite database with the message table. Only required
+        for the enrichment columns and the results that depend on them.
+
+    confidence : float, default=0.95
+        Confidence level used for all intervals.
+
+    engine : str, default='pandas'
+        Where the grouped metrics are computed: 'pandas', or 'sql' to push
+        them down into SQLite with `SqlMetricEngine`.
+
+    Examples
+    --------
+    >>> analysis = Analysis("eval.xlsx", "data/completed.db")
+    >>> analysis.grouped_metric('category', 'usefulness')
+    >>> analysis.correlations
+    """
+
+    def __init__(self, workbook_path, db_path=None, confidence=0.95, engine='pandas'):
+        if engine not in ('pandas', 'sql'):
+            raise ValueError(f"Invalid engine: '{engine}'. Must be 'pandas' or 'sql'.")
+        self.workbook_path = Path(workbook_path)
+        self.db_path = Path(db_path) if db_path is not None else None
+        self.confidence = confidence
+        self.engine = engine
+        self._grouped_metrics = {}
+
+    @cached_property
+    def df(self) -> pd.DataFrame:
+        """
+        The flattened action/response/scenario DataFrame from the workbook.
+        """
+        return load_file(self.workbook_path)
+
+    @cached_property
+    def text_store(self) -> MessageTextStore:
+        """
+        Message texts referenced by the enrichment columns, resolved lazily
+        from the database (which is kept open for that purpose).
+        """
+        if self.db_path is None:
+            raise ValueError("A database path is required for the enrichment columns.")
+
+        self._conn = sqlite3.connect(self.db_path)
+        return MessageTextStore(self._conn.cursor())
+
+    @cached_property
+    def sql_engine(self) -> SqlMetricEngine:
+        """
+        The workbook rows loaded into SQLite next to the message table.
+        """
+        return SqlMetricEngine(self.df, self.db_path, confidence=self.confidence)
+
+    @cached_property
+    def enriched_df(self) -> pd.DataFrame:
+        """
+        The flattened DataFrame with the database enrichment columns added.
+        Texts are referenced by 'message_ref', 'root_ref' and 'parent_ref';
+        use `text_store.resolve` to materialize them.
+        """
+        return add_db_to_df(self.text_store.cur, self.df.copy(), self.text_store)
+
+    def close(self):
+        """
+        Close the database connections, if any were opened.
+        """
+        if getattr(self, '_conn', None) is not None:
+            self._conn.close()
+            self._conn = None
+        if 'sql_engine' in self.__dict__:
+            self.sql_engine.close()
+            del self.sql_engine
+
+    def grouped_metric(self, group_col: str, metric_col: str, filters=None) -> pd.DataFrame:
+        """
+        Numeric summary of one metric by one grouping column.
+
+        The analysis level and binary condition are taken from `METRICS`.
+        Grouping or filtering on an enrichment column (e.g. 'message_depth')
+        uses the enriched DataFrame.
+
+        Parameters
+        ----------
+        filters : dict, optional
+            Column values rows must equal. Rows are filtered before they are
+            deduplicated to the metric's analysis level.
+
+        Returns
+        -------
+        pd.DataFrame
+            Columns: group_col, 'mean', 'n', 'ci_lower', 'ci_upper'.
+        """
+        filters = filters or {}
+        key = (group_col, metric_col, tuple(sorted(filters.items())))
+        if key not in self._grouped_metrics:
+            spec = {m[0]: m for m in METRICS}
+            if metric_col not in spec:
+                raise ValueError(f"Unknown metric: '{metric_col}'.")
+            _, level, condition, _ = spec[metric_col]
+
+            if self.engine == 'sql':
+                self._grouped_metrics[key] = self.sql_engine.grouped_metric(group_col, metric_col, filters)
+            else:
+                df = self.df
+                if any(col not in df.columns for col in [group_col, *filters]):
+                    df = self.enriched_df
+                for col in [group_col, *filters]:
+                    if col not in df.columns:
+                        raise ValueError(f"Unknown column: '{col}'.")
+                for col, value in filters.items():
+                    df = df[df[col].eq(value).fillna(False).astype(bool)]
+
+                self._grouped_metrics[key] = compute_grouped_metric(
+                    df,
+                    group_col=group_col,
+                    metric_col=metric_col,
+                    analysis_level=level,
+                    binary_condition=condition,
+                    confidence=self.confidence,
+                )
+        return self._grouped_metrics[key]
+
+    def metric_table(self, group_col: str) -> pd.DataFrame:
+        """
+        All metrics in `METRICS` for one grouping column, in long form.
+
+        Returns
+        -------
+        pd.DataFrame
+            Columns: group_col, 'metric', 'level', 'mean', 'n', 'ci_lower', 'ci_upper'.
+        """
+        tables = []
+        for metric_col, level, _, _ in METRICS:
+            table = self.grouped_metric(group_col, metric_col)
+            tables.append(table.assign(metric=metric_col, level=level))
+
+        combined = pd.concat(tables, ignore_index=True)
+        return combined[[group_col, 'metric', 'level', 'mean', 'n', 'ci_lower', 'ci_upper']]
+
+    @cached_property
+    def tables(self) -> dict:
+        """
+        `metric_table` for every grouping column in `GROUP_COLS`.
+        """
+        return {group_col: self.metric_table(group_col) for group_col in GROUP_COLS}
+
+    @cached_property
+    def presented_tables(self) -> dict:
+        """
+        The formatted tables exported as LaTeX, as returned by
+        `present_analysis_tables`.
+        """
+        engine = self.sql_engine if self.engine == 'sql' else None
+        return present_analysis_tables(analyze_data(self.df, engine=engine))
+
+    @cached_property
+    def variance_decomposition(self) -> pd.DataFrame:
+        """
+        Variance components, ICCs and overall design effects per metric, as
+        returned by `variance_decomposition`.
+        """
+        return variance_decomposition(self.df)
+
+    @cached_property
+    def design_effects(self) -> pd.DataFrame:
+        """
+        Design-effect-adjusted intervals for every metric and grouping, as
+        returned by `analyze_design_effects`.
+        """
+        return analyze_design_effects(
+            self.df,
+            confidence=self.confidence,
+            decomposition=self.variance_decomposition,
+        )
+
+    @cached_property
+    def presented_variance_tables(self) -> dict:
+        """
+        The formatted variance tables exported as LaTeX.
+        """
+        return present_variance_tables(self.variance_decomposition, self.design_effects)
+
+    @cached_property
+    def correlations(self) -> pd.DataFrame:
+        """
+        Correlation results as returned by `compute_correlations`.
+        """
+        return compute_correlations(self.enriched_df, confidence=self.confidence)
+
+    @cached_property
+    def tree_check(self) -> pd.DataFrame:
+        """
+        Sheet tree values compared with the message table, as returned by
+        `validate_sheet_tree_values`.
+        """
+        return validate_sheet_tree_values(self.enriched_df)
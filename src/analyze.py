@@ -1,7 +1,53 @@
-from .metrics import analyze_grouped_metric
+from .metrics import analyze_grouped_metric, format_grouped_metric
+import numpy as np
 import pandas as pd
 
-def analyze_data(df: pd.DataFrame) -> dict:
+GROUP_COLS = ['context-level', 'category', 'scenario']
+
+# (metric column, analysis level, binary condition, presentation format)
+METRICS = [
+    ('usefulness',              'action',   None,               'zero-to-five'),
+    ('actionability',           'action',   None,               'zero-to-five'), 
+    ('duplicate',               'action',   lambda x: x == 'Y', 'percentage'),
+    ('relevant',                'action',   lambda x: x == 'Y', 'percentage'),
+    ('action_hallucination',    'action',   lambda x: x == 'Y', 'percentage'),
+    ('reasoning_quality',       'response', None,               'zero-to-five'), 
+    ('reasoning_hallucination', 'response', lambda x: x == 'Y', 'percentage'),
+    ('success',                 'scenario', lambda x: x == 1,   'percentage'), 
+    ('tree_depth',              'scenario', None,               None), 
+    ('num_branches',            'scenario', None,               None), 
+    ('num_responses',           'scenario', None,               None),
+]
+
+# Columns identifying one unit at each analysis level, outermost first
+LEVEL_UNIT_COLS = {
+    'action':   ['scenario', 'response_id', 'action_name'],
+    'response': ['scenario', 'response_id'],
+    'scenario': ['scenario'],
+}
+
+# Column a level is deduplicated on, as in `filter_data_for_analysis`; action rows are used as-is
+LEVEL_KEYS = {'action': None, 'response': 'response_id', 'scenario': 'scenario'}
+
+def binary_values(values: pd.Series, binary_condition) -> pd.Series:
+    """
+    Convert a binary metric to 0/1 floats, evaluating the condition once per
+    distinct value. Blank cells count as 0, as in `analyze_grouped_metric`.
+    """
+    codes, uniques = pd.factorize(values)
+    flags = np.array([1.0 if binary_condition(u) else 0.0 for u in uniques] + [0.0])
+    return pd.Series(flags[codes], index=values.index, name=values.name)
+
+def metric_values(values: pd.Series, binary_condition=None) -> pd.Series:
+    """
+    A metric column as floats: binary metrics as 0/1 (see `binary_values`),
+    other metrics with non-numeric cells as NaN.
+    """
+    if binary_condition is not None:
+        return binary_values(values, binary_condition)
+    return pd.to_numeric(values, errors='coerce').astype(float)
+
+def analyze_data(df: pd.DataFrame, engine=None) -> dict:
     """
     Run grouped metric analyses on the input DataFrame across multiple levels
     and return a dictionary of summary DataFrames grouped by the specified dimensions.
@@ -11,41 +57,39 @@ def analyze_data(df: pd.DataFrame) -> dict:
     df : pd.DataFrame
         The original DataFrame with flattened action/response/scenario data.
 
+    engine : SqlMetricEngine, optional
+        If given, the grouped metrics are computed in SQL by the engine
+        instead of in pandas. The formatted tables are the same.
+
     Returns
     -------
     dict[str, pd.DataFrame]
         A dictionary where each key is a group column (e.g., 'context-level'),
         and the value is a summary DataFrame of aggregated metrics.
     """
-    group_cols = ['context-level', 'category', 'scenario']
-    metrics = [
-        ('usefulness',              'action',   None,               'zero-to-five'),
-        ('actionability',           'action',   None,               'zero-to-five'), 
-        ('duplicate',               'action',   lambda x: x == 'Y', 'percentage'),
-        ('relevant',                'action',   lambda x: x == 'Y', 'percentage'),
-        ('action_hallucination',    'action',   lambda x: x == 'Y', 'percentage'),
-        ('reasoning_quality',       'response', None,               'zero-to-five'), 
-        ('reasoning_hallucination', 'response', lambda x: x == 'Y', 'percentage'),
-        ('success',                 'scenario', lambda x: x == 1,   'percentage'), 
-        ('tree_depth',              'scenario', None,               None), 
-        ('num_branches',            'scenario', None,               None), 
-        ('num_responses',           'scenario', None,               None),
-    ]
-
     results_by_group = {}
 
-    for group_col in group_cols:
+    for group_col in GROUP_COLS:
         combined_df = None
 
-        for metric_col, level, condition, format_ in metrics:
-            result_df = analyze_grouped_metric(
-                df,
-                group_col=group_col,
-                metric_col=metric_col,
-                analysis_level=level,
-                binary_condition=condition,
-                special_formatting=format_,
-            )
+        for metric_col, level, condition, format_ in METRICS:
+            if engine is not None:
+                result_df = format_grouped_metric(
+                    engine.grouped_metric(group_col, metric_col),
+                    group_col=group_col,
+                    metric_col=metric_col,
+                    analysis_level=level,
+                    special_formatting=format_,
+                )
+            else:
+                result_df = analyze_grouped_metric(
+                    df,
+                    group_col=group_col,
+                    metric_col=metric_col,
+                    analysis_level=level,
+                    binary_condition=condition,
+                    special_formatting=format_,
+                )
 
             if combined_df is None:
                 combined_df = result_df
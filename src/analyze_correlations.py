@@ -1,60 +1,107 @@
+import pandas as pd
+
 from .corr_helper import (
+    check_pvalue,
+    correlation_confidence_interval,
     correlation_confidence_margin,
     present_corr,
 )
-from .correlations import calculate_correlation_with_p
+from .correlations import paired_correlation, rollup_level
 
-def analyze_correlations(df):
+# (column1, column2, level, value mapping applied to column1 before correlating)
+CORRELATION_PAIRS = [
+    # 1. reasoning quality vs usefulness (action level)
+    ('reasoning_quality',                  'usefulness', 'action', None),
+    # 2. Tree depth vs usefulness (action level)
+    ('tree_depth',                         'usefulness', 'action', None),
+    # 3. Content length vs usefulness (action level)
+    ('concatenated_text_from_root_length', 'usefulness', 'action', None),
+    # 4. Reasoning Hallucination vs usefulness (action level)
+    ('reasoning_hallucination',            'usefulness', 'action', {'Y': 1, 'N': 0}),
+]
 
-    ret = ""
+def compute_correlations(df, confidence=0.95, reducer='mean'):
+    """
+    Compute every correlation in `CORRELATION_PAIRS`.
 
-    # 1. reasoning quality vs usefulness (action level)
-    c1, c2 = 'reasoning_quality', 'usefulness'
-    r, p = calculate_correlation_with_p(
-        df,
-        column1=c1,
-        column2=c2,
-        level='action'
-    )
-    r_margin = correlation_confidence_margin(r, len(df), confidence=0.95)
-    corr = present_corr(p, r, r_margin)
-    ret += f"\n{c1} vs {c2}\n{corr}\n"
+    Response- and scenario-level pairs are computed on rollups of the rows
+    of each unit (see `rollup_level`), built with one groupby per level that
+    is shared by all pairs at that level.
 
-    # 2. Tree depth vs usefulness (action level)
-    c1, c2 = 'tree_depth', 'usefulness'
-    r, p = calculate_correlation_with_p(
-        df,
-        column1=c1,
-        column2=c2,
-        level='action'
-    )
-    r_margin = correlation_confidence_margin(r, len(df), confidence=0.95)
-    corr = present_corr(p, r, r_margin)
-    ret += f"\n{c1} vs {c2}\n{corr}\n"
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The flattened DataFrame, enriched with the database columns.
 
-    # 3. Content length vs usefulness (action level)
-    c1, c2 = 'concatenated_text_from_root_length', 'usefulness'
-    r, p = calculate_correlation_with_p(
-        df,
-        column1=c1,
-        column2=c2,
-        level='action'
-    )
-    r_margin = correlation_confidence_margin(r, len(df), confidence=0.95)
-    corr = present_corr(p, r, r_margin)
-    ret += f"\n{c1} vs {c2}\n{corr}\n"
+    confidence : float, default=0.95
+        Confidence level for the Fisher-z margin of each coefficient.
 
-    # 4. Reasoning Hallucination vs usefulness (action level)
-    c1, c2 = 'reasoning_hallucination', 'usefulness'
-    r, p = calculate_correlation_with_p(
-        df[[c1, c2]].assign(reasoning_hallucination=df[c1].map({'Y': 1, 'N': 0})),
-        column1=c1,
-        column2=c2,
-        level='action'
-    )
-    r_margin = correlation_confidence_margin(r, len(df), confidence=0.95)
-    corr = present_corr(p, r, r_margin)
-    ret += f"\n{c1} vs {c2}\n{corr}\n"
-    
-
-    return ret
\ No newline at end of file
+    reducer : str or dict[str, str], default='mean'
+        How rows are combined per response or scenario: 'mean', 'max' or
+        'any', for all columns or per column.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per pair with columns 'column1', 'column2', 'level', 'r',
+        'p_value', 'n' (paired observations), 'r_margin' (the upper-side
+        margin that is printed), 'ci_lower', 'ci_upper' (the asymmetric
+        Fisher-z interval) and 'significant'.
+    """
+    # Mapped columns get their own name, so the unmapped column stays usable
+    data = {}
+    names = []
+    for i, (c1, c2, level, mapping) in enumerate(CORRELATION_PAIRS):
+        name1 = c1 if mapping is None else f'{c1}__mapped_{i}'
+        data[name1] = df[c1] if mapping is None else df[c1].map(mapping)
+        data[c2] = df[c2]
+        names.append(name1)
+    for key in ('response_id', 'scenario'):
+        if key in df.columns:
+            data.setdefault(key, df[key])
+    data = pd.DataFrame(data)
+
+    if isinstance(reducer, dict):
+        reducer = {names[i]: reducer[c1] for i, (c1, *_) in enumerate(CORRELATION_PAIRS) if c1 in reducer} | reducer
+
+    rollups = {}
+    for level in dict.fromkeys(pair[2] for pair in CORRELATION_PAIRS):
+        columns = [col for name1, (_, c2, pair_level, _) in zip(names, CORRELATION_PAIRS) if pair_level == level for col in (name1, c2)]
+        rollups[level] = rollup_level(data, columns, level=level, reducer=reducer)
+
+    rows = []
+
+    for name1, (c1, c2, level, _) in zip(names, CORRELATION_PAIRS):
+        r, p, n = paired_correlation(rollups[level], name1, c2)
+        r_margin = correlation_confidence_margin(r, n, confidence=confidence)
+        ci_lower, ci_upper = correlation_confidence_interval(r, n, confidence=confidence)
+
+        rows.append({
+            'column1': c1,
+            'column2': c2,
+            'level': level,
+            'r': float(r),
+            'p_value': float(p),
+            'n': n,
+            'r_margin': float(r_margin),
+            'ci_lower': float(ci_lower),
+            'ci_upper': float(ci_upper),
+            'significant': bool(check_pvalue(p)),
+        })
+
+    return pd.DataFrame(rows)
+
+def present_correlations(correlations):
+    """
+    Format the output of `compute_correlations` as a printable string.
+    """
+    ret = ""
+
+    for row in correlations.itertuples(index=False):
+        corr = present_corr(row.p_value, row.r, row.r_margin)
+        ret += f"\n{row.column1} vs {row.column2}\n{corr}\n"
+
+    return ret
+
+def analyze_correlations(df):
+    return present_correlations(compute_correlations(df))
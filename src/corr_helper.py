@@ -25,6 +25,27 @@ def correlation_confidence_margin(r, n, confidence=0.95):
 
     return r_margin
 
+def correlation_confidence_interval(r, n, confidence=0.95):
+    """
+    Calculate the confidence interval for a Pearson correlation coefficient
+    using Fisher's z transformation. The interval is not symmetric around r.
+
+    Parameters:
+    r (float): Pearson correlation coefficient.
+    n (int): Sample size.
+    confidence (float): Confidence level, e.g., 0.95 for 95% CI.
+
+    Returns:
+    tuple: (lower bound, upper bound) of the interval.
+    """
+    if n <= 3:
+        raise ValueError("Sample size must be greater than 3 for Fisher transformation.")
+
+    z = np.arctanh(r)
+    z_margin = norm.ppf(1 - (1 - confidence) / 2) / np.sqrt(n - 3)
+
+    return np.tanh(z - z_margin), np.tanh(z + z_margin)
+
 def check_pvalue(p_value):
     """
     Check if the p-value indicates statistical significance.
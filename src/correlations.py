@@ -1,11 +1,107 @@
 from scipy.stats import pearsonr
 import pandas as pd
 
+from .analyze import LEVEL_KEYS, binary_values
+
+# How the rows of a response or scenario are combined into one value
+REDUCERS = ('mean', 'max', 'any')
+
+def _numeric(values: pd.Series) -> pd.Series:
+    """
+    A column as floats, with Y/N answers converted to 1/0 (blank cells
+    count as 0, as for the Y/N metrics).
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    present = set(values.dropna().unique())
+    if not present <= {'Y', 'N'}:
+        raise ValueError(f"Column '{values.name}' is neither numeric nor Y/N.")
+    return binary_values(values, lambda x: x == 'Y')
+
+def rollup_level(
+    df: pd.DataFrame,
+    columns: list,
+    level: str = 'action',
+    reducer='mean'
+) -> pd.DataFrame:
+    """
+    Aggregate columns to one row per unit of a level with a single groupby.
+
+    Y/N columns are converted to 1/0 first. At the scenario level, columns
+    that are constant within every response (such as 'reasoning_quality')
+    are taken once per response, so responses with more actions do not
+    weigh more.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The DataFrame containing the data.
+
+    columns : list[str]
+        Columns to aggregate.
+
+    level : str, optional (default='action')
+        Level of aggregation: 'action', 'response', or 'scenario'.
+
+    reducer : str or dict[str, str], optional (default='mean')
+        How the rows of a unit are combined, for all columns or per column:
+        - 'mean': average of the present values
+        - 'max': largest present value
+        - 'any': 1 if any value is 'Y' (or positive, for numeric columns), else 0
+        Units where a column has no present values get NaN.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per unit with the aggregated columns.
+    """
+    if level not in LEVEL_KEYS:
+        raise ValueError(f"Invalid level: '{level}'. Choose from 'action', 'response', or 'scenario'.")
+
+    columns = list(dict.fromkeys(columns))
+    key = LEVEL_KEYS[level]
+    if key is not None and key not in df.columns:
+        raise ValueError(f"Column '{key}' is required for {level}-level analysis.")
+
+    reducers = reducer if isinstance(reducer, dict) else dict.fromkeys(columns, reducer)
+    data = df[[c for c in dict.fromkeys([key, 'response_id']) if c in df.columns] + columns].copy()
+    agg = {}
+    for col in columns:
+        reducer_name = reducers.get(col, 'mean')
+        if reducer_name not in REDUCERS:
+            raise ValueError(f"Invalid reducer: '{reducer_name}'. Choose from {', '.join(REDUCERS)}.")
+        if reducer_name == 'any':
+            values = _numeric(data[col])
+            data[col] = values.gt(0).astype(float).where(values.notna())
+            reducer_name = 'max'
+        else:
+            data[col] = _numeric(data[col])
+        agg[col] = reducer_name
+
+    if key is None:
+        return data[columns]
+
+    if level != 'scenario' or 'response_id' not in data.columns:
+        return data.groupby(key, sort=False).agg(agg).reset_index(drop=True)
+
+    # Response-level columns count once per response
+    constant = data.groupby('response_id', sort=False)[columns].nunique().le(1).all()
+    response_cols = [col for col in columns if constant[col]]
+    action_cols = [col for col in columns if not constant[col]]
+    parts = []
+    if action_cols:
+        parts.append(data.groupby(key, sort=False).agg({col: agg[col] for col in action_cols}))
+    if response_cols:
+        responses = data.drop_duplicates(subset='response_id')
+        parts.append(responses.groupby(key, sort=False).agg({col: agg[col] for col in response_cols}))
+    return pd.concat(parts, axis=1)[columns].reset_index(drop=True)
+
 def calculate_correlation_with_p(
     df: pd.DataFrame,
     column1: str,
     column2: str,
-    level: str = 'action'
+    level: str = 'action',
+    reducer='mean'
 ):
     """
     Calculate the Pearson correlation and p-value between two columns,
@@ -25,30 +121,29 @@ def calculate_correlation_with_p(
     level : str, optional (default='action')
         Level of aggregation: 'action', 'response', or 'scenario'.
 
+    reducer : str or dict[str, str], optional (default='mean')
+        How rows are combined per response or scenario, see `rollup_level`.
+
     Returns
     -------
     tuple
         (correlation coefficient, p-value)
     """
-    if level == 'action':
-        # Use all rows as-is
-        data = df[[column1, column2]].dropna()
-
-    elif level == 'response':
-        # Deduplicate by response_id
-        if 'response_id' not in df.columns:
-            raise ValueError("Column 'response_id' is required for response-level analysis.")
-        data = df[['response_id', column1, column2]].drop_duplicates(subset='response_id').dropna()
-
-    elif level == 'scenario':
-        # Deduplicate by scenario
-        if 'scenario' not in df.columns:
-            raise ValueError("Column 'scenario' is required for scenario-level analysis.")
-        data = df[['scenario', column1, column2]].drop_duplicates(subset='scenario').dropna()
-
-    else:
-        raise ValueError(f"Invalid level: '{level}'. Choose from 'action', 'response', or 'scenario'.")
+    data = rollup_level(df, [column1, column2], level=level, reducer=reducer)
 
     # Run correlation
-    r, p = pearsonr(data[column1], data[column2])
+    r, p, _ = paired_correlation(data, column1, column2)
     return r, p
+
+def paired_correlation(data: pd.DataFrame, column1: str, column2: str):
+    """
+    Pearson correlation over the rows where both columns are present.
+
+    Returns
+    -------
+    tuple
+        (correlation coefficient, p-value, number of paired observations)
+    """
+    pairs = data[[column1, column2]].dropna()
+    r, p = pearsonr(pairs[column1], pairs[column2])
+    return r, p, len(pairs)
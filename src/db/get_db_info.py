@@ -1,34 +1,41 @@
-import sqlite3
+import numpy as np
+import pandas as pd
 
-from .queries import (
-    get_depth,
-    get_text,
-    get_parent_text,
-    get_root_text,
-    get_concatenated_text_from_root,
-)
+from .tree_stats import add_tree_stats_to_df
+from .text_store import MessageTextStore
 
-def add_db_to_df(cur, df):
+def add_db_to_df(cur, df, text_store=None):
     """
     Add database information to the DataFrame.
+
+    Message texts are not copied into the frame. Instead 'message_ref',
+    'root_ref' and 'parent_ref' reference the text store, which holds each
+    distinct text once and loads it when it is first resolved.
     """
-    # Get the message depth
-    df['message_depth'] = df['response_id'].apply(lambda x: get_depth(cur, x))
-    
-    # Get the message text
-    df['message_text'] = df['response_id'].apply(lambda x: get_text(cur, x))
-    
-    # Get the root text
-    df['root_text'] = df['response_id'].apply(lambda x: get_root_text(cur, x))
-    
-    # Get the parent message text
-    df['parent_text'] = df['response_id'].apply(lambda x: get_parent_text(cur, x))
-    
-    # Get the concatenated text from root
-    df['concatenated_text_from_root'] = df['response_id'].apply(lambda x: get_concatenated_text_from_root(cur, x))
-
-    # Get the total length of the concatenated text
-    df['concatenated_text_from_root_length'] = df['concatenated_text_from_root'].apply(lambda x: len(x.split()))
-    
+    if text_store is None:
+        text_store = MessageTextStore(cur)
+
+    # Get the message depth and conversation tree statistics
+    df = add_tree_stats_to_df(df, text_store.tree_stats)
+
+    # Get the message, root and parent references
+    message_refs = text_store.refs(df['response_id'])
+    known = message_refs >= 0
+    df['message_ref'] = pd.array(np.where(known, message_refs, None), dtype='Int64')
+    root_refs = text_store.roots[message_refs]
+    df['root_ref'] = pd.array(np.where(known & (root_refs >= 0), root_refs, None), dtype='Int64')
+    parent_refs = text_store.parents[message_refs]
+    df['parent_ref'] = pd.array(np.where(known & (parent_refs >= 0), parent_refs, None), dtype='Int64')
+
+    # Get the total length of the concatenated text from root, once per distinct message,
+    # loading the texts of all ancestors in one batch
+    paths = {ref: text_store.path_from_root(ref) for ref in np.unique(message_refs[known])}
+    text_store.texts(sorted({ancestor for path in paths.values() for ancestor in path}))
+    lengths = {
+        ref: len("".join(text or "" for text in text_store.texts(path)).split())
+        for ref, path in paths.items()
+    }
+    df['concatenated_text_from_root_length'] = [lengths.get(ref, 0) for ref in message_refs]
+
     return df
 
@@ -16,7 +16,8 @@ def get_text(cur,response_id):
     cur.execute("""
                 SELECT text FROM message WHERE HEX(id) = ?
                 """, (response_id.replace('-','').upper(),))
-    return cur.fetchone()
+    result = cur.fetchone()
+    return result[0] if result else None
 
 def get_root_text(cur,response_id):
     cur.execute("""
@@ -43,7 +44,8 @@ def get_parent_text(cur,response_id):
     cur.execute("""
                 SELECT text FROM message WHERE id = (SELECT parent_id FROM message WHERE HEX(id) = ?)
                 """, (response_id.replace('-','').upper(),))
-    return cur.fetchone()
+    result = cur.fetchone()
+    return result[0] if result else None
 
 def get_concatenated_text_from_root(cur,response_id):
     cur.execute("""
@@ -70,3 +72,21 @@ def get_concatenated_text_from_root(cur,response_id):
     texts = [text for _, text in all_rows[:-1]]
     return "".join(texts)
 
+
+def get_message_edges(cur):
+    cur.execute("""
+                SELECT HEX(id), HEX(parent_id) FROM message
+                """)
+    return cur.fetchall()
+
+def get_texts(cur,message_ids):
+    # Batched to stay below SQLite's limit on bound parameters; ids are bound
+    # as blobs so the lookup uses the primary key index
+    texts = {}
+    for start in range(0, len(message_ids), 500):
+        batch = message_ids[start:start + 500]
+        cur.execute(f"""
+                    SELECT HEX(id), text FROM message WHERE id IN ({','.join('?' * len(batch))})
+                    """, [bytes.fromhex(message_id) for message_id in batch])
+        texts.update(cur.fetchall())
+    return texts
@@ -0,0 +1,241 @@
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from ..analyze import METRICS, LEVEL_KEYS, binary_values
+
+# Columns computed from the message tree, usable as grouping and filter columns
+ANCESTRY_COLS = ['message_depth', 'ancestor_count', 'ancestry_length', 'root_id']
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _response_key(response_id):
+    """
+    A response id as the 16-byte blob stored in the message table. Ids that
+    are not UUIDs are kept as text, so they never match a message.
+    """
+    if pd.isna(response_id):
+        return None
+    try:
+        return bytes.fromhex(str(response_id).replace('-', ''))
+    except ValueError:
+        return str(response_id)
+
+
+class SqlMetricEngine:
+    """
+    Grouped metrics computed inside SQLite, next to the message table.
+
+    The flattened evaluation rows are bulk-loaded into an in-memory database
+    attached to the message database (as `eval`), keyed by the response id
+    as a blob so they join directly on the message primary key. Note columns
+    are not loaded. Grouped means, counts and variances, and the message
+    depth and ancestry of every response, are computed in SQL; only the
+    t-quantiles of the intervals are computed in Python.
+
+    Results match `compute_grouped_metric`, including its deduplication per
+    analysis level and its counting of missing values in 'n'.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The flattened action/response/scenario DataFrame.
+
+    db_path : str or Path, optional
+        Path to the SQLite database with the message table. Required only
+        for the ancestry columns.
+
+    confidence : float, default=0.95
+        Confidence level for the intervals.
+
+    The engine can be shared between threads; queries are serialized on
+    its connection.
+    """
+
+    def __init__(self, df: pd.DataFrame, db_path=None, confidence: float=0.95):
+        self.db_path = db_path
+        self.confidence = confidence
+        self.conn = sqlite3.connect(':memory:' if db_path is None else str(db_path), check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.execute("ATTACH DATABASE ':memory:' AS eval")
+        self._has_ancestry = False
+
+        self.columns = [col for col in df.columns if not col.endswith('notes')]
+        self.binary = {}
+        for metric_col, _, condition, _ in METRICS:
+            if condition is not None and metric_col in df.columns:
+                self.binary[metric_col] = f'{metric_col}__code'
+        self._load(df)
+
+    def _load(self, df: pd.DataFrame):
+        data = df[self.columns].astype(object).where(df[self.columns].notna(), None)
+        data['response_id'] = [_response_key(value) for value in df['response_id']]
+        for metric_col, code_col in self.binary.items():
+            condition = next(m[2] for m in METRICS if m[0] == metric_col)
+            data[code_col] = binary_values(df[metric_col], condition).astype(int).tolist()
+
+        columns = list(data.columns)
+        self.conn.execute(
+            f"CREATE TABLE eval.rows ({', '.join(_quote(col) for col in columns)})"
+        )
+        self.conn.executemany(
+            f"INSERT INTO eval.rows VALUES ({', '.join('?' * len(columns))})",
+            data.itertuples(index=False, name=None),
+        )
+        self.conn.execute("CREATE INDEX eval.rows_response ON rows (response_id)")
+        self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _build_ancestry(self):
+        """
+        Depth, root and ancestor text length of every loaded response,
+        walking up the message tree from the response in one recursive query.
+        """
+        with self._lock:
+            if not self._has_ancestry:
+                self._create_ancestry()
+
+    def _create_ancestry(self):
+        if self.db_path is None:
+            raise ValueError("A database path is required for the ancestry columns.")
+
+        # A chain can be at most as long as the message table; a chain that
+        # reaches that length is a parent_id cycle and, as in
+        # `compute_tree_stats`, gets no depth or root
+        self.conn.execute("""
+            CREATE TABLE eval.ancestry AS
+            WITH RECURSIVE limits(n) AS (SELECT COUNT(*) FROM main.message),
+            chain(response_id, id, parent_id, depth, length) AS (
+                SELECT r.response_id, m.id, m.parent_id, 0, 0
+                FROM (SELECT DISTINCT response_id FROM eval.rows) r
+                JOIN main.message m ON m.id = r.response_id
+
+                UNION ALL
+
+                SELECT c.response_id, m.id, m.parent_id, c.depth + 1, c.length + COALESCE(LENGTH(m.text), 0)
+                FROM chain c
+                JOIN main.message m ON m.id = c.parent_id
+                WHERE c.depth < (SELECT n FROM limits)
+            ),
+            ends AS (
+                -- SQLite takes the bare columns from the row with the largest depth: the root
+                SELECT response_id, MAX(depth) AS depth, length, HEX(id) AS root_id
+                FROM chain
+                GROUP BY response_id
+            )
+            SELECT response_id,
+                   CASE WHEN NOT cyclic THEN (depth + 1) / 2 END AS message_depth,
+                   CASE WHEN NOT cyclic THEN depth END AS ancestor_count,
+                   CASE WHEN NOT cyclic THEN length END AS ancestry_length,
+                   CASE WHEN NOT cyclic THEN root_id END AS root_id
+            FROM (SELECT *, depth >= (SELECT n FROM limits) AS cyclic FROM ends)
+        """)
+        self.conn.execute("CREATE INDEX eval.ancestry_response ON ancestry (response_id)")
+        self._has_ancestry = True
+
+    def ancestry(self) -> pd.DataFrame:
+        """
+        Message depth (as `get_depth` computes it), number of ancestors,
+        total character length of the ancestor texts and root id of every
+        response, indexed by the hex response id.
+        """
+        self._build_ancestry()
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT HEX(response_id), {', '.join(ANCESTRY_COLS)} FROM eval.ancestry ORDER BY 1"
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['response_id'] + ANCESTRY_COLS).set_index('response_id')
+
+    def _column_expr(self, col: str, kind: str) -> str:
+        if col in ANCESTRY_COLS:
+            self._build_ancestry()
+            return f'a.{col}'
+        if col in self.columns:
+            return f'r.{_quote(col)}'
+        raise ValueError(f"Unknown {kind} column: '{col}'.")
+
+    def grouped_metric(self, group_col: str, metric_col: str, filters=None) -> pd.DataFrame:
+        """
+        Mean, sample size and t-based confidence interval of a metric by group.
+
+        The analysis level and binary condition are taken from `METRICS`.
+        Besides the workbook columns, `group_col` and the filter columns may
+        be one of `ANCESTRY_COLS`.
+
+        Parameters
+        ----------
+        filters : dict, optional
+            Column values rows must equal. Rows are filtered before they are
+            deduplicated to the metric's analysis level.
+
+        Returns
+        -------
+        pd.DataFrame
+            Columns: group_col, 'mean', 'n', 'ci_lower', 'ci_upper', as
+            returned by `compute_grouped_metric`.
+        """
+        spec = {m[0]: m for m in METRICS}
+        if metric_col not in spec:
+            raise ValueError(f"Unknown metric: '{metric_col}'.")
+        level = spec[metric_col][1]
+        filters = filters or {}
+
+        group_expr = self._column_expr(group_col, 'group')
+        conditions = [f'{group_expr} IS NOT NULL']
+        params = []
+        for col, value in filters.items():
+            conditions.append(f"{self._column_expr(col, 'filter')} = ?")
+            params.append(value.item() if hasattr(value, 'item') else value)
+        where = ' AND '.join(conditions)
+
+        source = 'eval.rows r'
+        if self._has_ancestry:
+            source += ' LEFT JOIN eval.ancestry a ON a.response_id = r.response_id'
+
+        # Units are deduplicated on the raw value; Y/N metrics are averaged as 0/1 codes
+        value_expr = f'r.{_quote(metric_col)}'
+        code_expr = f'r.{_quote(self.binary[metric_col])}' if metric_col in self.binary else value_expr
+        key = LEVEL_KEYS[level]
+        if key is None:
+            units = f"SELECT {group_expr} AS grp, {code_expr} AS value FROM {source} WHERE {where}"
+        else:
+            units = (
+                f"SELECT DISTINCT r.{_quote(key)} AS unit, {group_expr} AS grp, {value_expr} AS raw, {code_expr} AS value"
+                f" FROM {source} WHERE {where}"
+            )
+
+        with self._lock:
+            rows = self.conn.execute(f"""
+                WITH units AS ({units}),
+                totals AS (
+                    SELECT grp, COUNT(*) AS n, AVG(value) AS mean FROM units GROUP BY grp
+                )
+                SELECT t.grp, t.mean, t.n,
+                       SUM((u.value - t.mean) * (u.value - t.mean)) / (COUNT(u.value) - 1.0) AS variance
+                FROM totals t
+                JOIN units u ON u.grp = t.grp
+                GROUP BY t.grp
+                ORDER BY t.grp
+                """, params).fetchall()
+
+        result = pd.DataFrame(rows, columns=[group_col, 'mean', 'n', 'variance'])
+        result['mean'] = result['mean'].astype(float)
+        result['n'] = result['n'].astype(int)
+
+        # Like `compute_grouped_metric`: the standard deviation is over the
+        # present values, the standard error over all units of the group
+        margin = stats.t.ppf((1 + self.confidence) / 2, df=result['n'] - 1) * np.sqrt(result['variance'].astype(float) / result['n'])
+        margin = margin.where(result['n'] > 1)
+        result['ci_lower'] = result['mean'] - margin
+        result['ci_upper'] = result['mean'] + margin
+
+        return result[[group_col, 'mean', 'n', 'ci_lower', 'ci_upper']]
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+from .queries import get_texts
+from .tree_stats import load_tree_stats
+
+
+class MessageTextStore:
+    """
+    Side table holding each message text at most once, keyed by an integer
+    reference (the message's position in the tree statistics).
+
+    The enriched DataFrame only stores references ('message_ref',
+    'parent_ref', 'root_ref'). Texts are fetched from the database the first
+    time they are resolved and then cached, so a text shared by many actions,
+    responses or branches is held once, and texts no stage asks for are never
+    loaded.
+
+    Parameters
+    ----------
+    cur : sqlite3.Cursor
+        Cursor on the database with the message table. It must stay open for
+        as long as texts are resolved.
+
+    tree_stats : pd.DataFrame, optional
+        Output of `load_tree_stats`; loaded from `cur` if not given.
+    """
+
+    def __init__(self, cur, tree_stats=None):
+        self.cur = cur
+        self.tree_stats = load_tree_stats(cur) if tree_stats is None else tree_stats
+        self.ids = self.tree_stats.index
+        self.parents = self.ids.get_indexer(pd.Index(self.tree_stats['parent_id']))
+        self.roots = self.ids.get_indexer(pd.Index(self.tree_stats['root_id']))
+        self._texts = {}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def refs(self, message_ids) -> np.ndarray:
+        """
+        References for hex or dashed UUID message ids, -1 where unknown.
+        """
+        keys = pd.Index(message_ids).astype(str).str.replace('-', '').str.upper()
+        return self.ids.get_indexer(keys)
+
+    def texts(self, refs) -> list:
+        """
+        Resolve references to texts, loading any not yet cached in one batch.
+        Unknown references (-1 or missing values) resolve to None.
+        """
+        refs = [int(ref) if not pd.isna(ref) else -1 for ref in refs]
+        missing = sorted({ref for ref in refs if ref >= 0 and ref not in self._texts})
+        if missing:
+            loaded = get_texts(self.cur, [self.ids[ref] for ref in missing])
+            for ref in missing:
+                self._texts[ref] = loaded.get(self.ids[ref])
+        return [self._texts.get(ref) if ref >= 0 else None for ref in refs]
+
+    def text(self, ref):
+        """
+        Resolve a single reference to its text.
+        """
+        return self.texts([ref])[0]
+
+    def path_from_root(self, ref) -> list:
+        """
+        References of the ancestors of a message, from the root down to its
+        parent (the message itself is excluded).
+        """
+        path = []
+        ref = self.parents[ref] if ref >= 0 else -1
+        while ref >= 0 and len(path) < len(self.ids):
+            path.append(ref)
+            ref = self.parents[ref]
+        return path[::-1]
+
+    def concatenated_text_from_root(self, ref) -> str:
+        """
+        Texts of the ancestors of a message joined from the root down, as
+        `get_concatenated_text_from_root` returns them.
+        """
+        return "".join(text or "" for text in self.texts(self.path_from_root(ref)))
+
+    def resolve(self, df: pd.DataFrame, ref_col: str) -> pd.Series:
+        """
+        Text column for a reference column of an enriched DataFrame,
+        materialized on demand.
+        """
+        return pd.Series(self.texts(df[ref_col].tolist()), index=df.index, name=ref_col.replace('_ref', '_text'))
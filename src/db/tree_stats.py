@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from .queries import get_message_edges
+
+
+def _children_of(frontier, child_offsets, child_counts, children):
+    """
+    Gather the children of every node in `frontier` from the CSR child arrays.
+    """
+    counts = child_counts[frontier]
+    total = counts.sum()
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    starts = child_offsets[frontier]
+    # Position of each gathered child inside its parent's slice
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return children[np.repeat(starts, counts) + within]
+
+
+def compute_tree_stats(ids, parent_ids) -> pd.DataFrame:
+    """
+    Compute per-message statistics for a whole forest of conversation trees.
+
+    The forest is stored as a parent array with the children laid out in CSR
+    form. Depth and root are propagated from the roots downwards one level at
+    a time, then subtree size and leaf count are accumulated bottom-up over
+    the same levels, so every message is visited a constant number of times.
+
+    Parameters
+    ----------
+    ids : sequence of str
+        Hex message ids.
+
+    parent_ids : sequence of str or None
+        Hex parent id of each message, or None for roots. Parents that do not
+        exist in `ids` are treated as missing, making the message a root.
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexed by hex message id, with columns 'parent_id', 'depth' (edges
+        from the root), 'num_children', 'subtree_size', 'leaf_count' and 'root_id'.
+        Messages that are not reachable from a root (cycles) get depth -1.
+    """
+    ids = pd.Index(ids)
+    n = len(ids)
+    parent = ids.get_indexer(pd.Index(parent_ids)).astype(np.int64)
+
+    # CSR layout of the children of each node
+    has_parent = parent >= 0
+    children = np.flatnonzero(has_parent)
+    children = children[np.argsort(parent[children], kind='stable')]
+    child_counts = np.bincount(parent[has_parent], minlength=n).astype(np.int64)
+    child_offsets = np.cumsum(child_counts) - child_counts
+
+    depth = np.full(n, -1, dtype=np.int64)
+    root = np.full(n, -1, dtype=np.int64)
+
+    # Top-down: depth and root id, one level of the forest at a time
+    frontier = np.flatnonzero(~has_parent)
+    depth[frontier] = 0
+    root[frontier] = frontier
+    levels = []
+    while frontier.size:
+        levels.append(frontier)
+        next_frontier = _children_of(frontier, child_offsets, child_counts, children)
+        depth[next_frontier] = depth[parent[next_frontier]] + 1
+        root[next_frontier] = root[parent[next_frontier]]
+        frontier = next_frontier
+
+    # Bottom-up: subtree sizes and leaf counts
+    subtree_size = np.ones(n, dtype=np.int64)
+    leaf_count = (child_counts == 0).astype(np.int64)
+    for level in reversed(levels[1:]):
+        np.add.at(subtree_size, parent[level], subtree_size[level])
+        np.add.at(leaf_count, parent[level], leaf_count[level])
+
+    root_ids = np.where(root >= 0, ids.to_numpy()[np.maximum(root, 0)], None)
+    known_parent_ids = np.where(has_parent, ids.to_numpy()[np.maximum(parent, 0)], None)
+
+    return pd.DataFrame({
+        'parent_id': known_parent_ids,
+        'depth': depth,
+        'num_children': child_counts,
+        'subtree_size': subtree_size,
+        'leaf_count': leaf_count,
+        'root_id': root_ids,
+    }, index=ids)
+
+
+def load_tree_stats(cur) -> pd.DataFrame:
+    """
+    Load the id/parent_id columns of the whole message table once and
+    compute the tree statistics for every message.
+    """
+    edges = get_message_edges(cur)
+    ids = [message_id for message_id, _ in edges]
+    # HEX(NULL) is NULL, but guard against empty-string parents as well
+    parent_ids = [parent_id or None for _, parent_id in edges]
+    return compute_tree_stats(ids, parent_ids)
+
+
+def add_tree_stats_to_df(df: pd.DataFrame, tree_stats: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the tree statistics of each response's message as enrichment columns.
+
+    Depths follow the convention of `get_depth`: the number of user/assistant
+    exchanges, ((edges from root) + 1) // 2. The 'db_tree_depth' and
+    'db_num_branches' columns describe the whole conversation tree the
+    response belongs to and can be compared with the hand-entered
+    'tree_depth' and 'num_branches' sheet values.
+    """
+    keys = df['response_id'].astype(str).str.replace('-', '').str.upper()
+    stats = tree_stats.reindex(keys.to_numpy())
+    reachable = stats['depth'] >= 0
+
+    # Whole-tree aggregates, keyed by root id
+    in_tree = tree_stats[tree_stats['depth'] >= 0]
+    tree_depth = in_tree.groupby('root_id')['depth'].max()
+    tree_leaves = in_tree.loc[in_tree['root_id'].to_numpy() == in_tree.index.to_numpy(), 'leaf_count']
+
+    df['message_depth'] = ((stats['depth'] + 1) // 2).where(reachable).to_numpy()
+    df['message_num_children'] = stats['num_children'].to_numpy()
+    df['message_subtree_size'] = stats['subtree_size'].to_numpy()
+    df['message_leaf_count'] = stats['leaf_count'].to_numpy()
+    df['root_id'] = stats['root_id'].to_numpy()
+    df['db_tree_depth'] = ((df['root_id'].map(tree_depth) + 1) // 2).to_numpy()
+    df['db_num_branches'] = df['root_id'].map(tree_leaves).to_numpy()
+
+    return df
+
+
+def validate_sheet_tree_values(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compare the hand-entered 'tree_depth' and 'num_branches' sheet values with
+    the values derived from the message table.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per scenario with the sheet and database values side by side
+        and boolean 'depth_matches' / 'branches_matches' columns. A scenario
+        whose responses span several trees reports the largest tree.
+    """
+    per_scenario = df.groupby('scenario').agg(
+        tree_depth=('tree_depth', 'first'),
+        db_tree_depth=('db_tree_depth', 'max'),
+        num_branches=('num_branches', 'first'),
+        db_num_branches=('db_num_branches', 'max'),
+    ).reset_index()
+
+    per_scenario['depth_matches'] = per_scenario['tree_depth'] == per_scenario['db_tree_depth']
+    per_scenario['branches_matches'] = per_scenario['num_branches'] == per_scenario['db_num_branches']
+    return per_scenario
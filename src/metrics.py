@@ -3,21 +3,19 @@ import numpy as np
 from scipy import stats
 from .filter import filter_data_for_analysis
 
-def analyze_grouped_metric(
+def compute_grouped_metric(
     df: pd.DataFrame,
     group_col: str,
     metric_col: str,
     analysis_level: str,
     binary_condition=None,
     confidence: float=0.95,
-    special_formatting=False
-):
+) -> pd.DataFrame:
     """
-    Analyze and summarize a metric by group, with optional confidence intervals.
+    Compute the mean, sample size and t-based confidence interval of a metric by group.
 
-    This function groups a DataFrame by a specified column and calculates the mean
-    of a target metric. It optionally converts values to binary using a condition,
-    calculates confidence intervals, and formats the results for presentation.
+    This is the numeric core of `analyze_grouped_metric`, without any
+    presentation formatting.
 
     Parameters
     ----------
@@ -32,25 +30,19 @@ def analyze_grouped_metric(
 
     analysis_level : str
         analysis_level of analysis: one of 'action', 'response', or 'scenario'.
-        Used for determining deduplication and labeling in the output.
 
     binary_condition : callable, optional
-        A function that returns True for "positive" binary values (e.g., `lambda x: x == 'Yes'`).
+        A function that returns True for "positive" binary values.
         If provided, metric values are converted to 0 or 1.
 
     confidence : float, default=0.95
         Confidence level for computing confidence intervals (only used when n > 1).
 
-    special_formatting : str or bool, default=False
-        Optional output formatting style. Supported:
-        - 'percentage': Format mean as a percentage
-        - 'zero-to-five': Show mean and CI in 0–5 scale with interval in parentheses
-
     Returns
     -------
     pandas.DataFrame
-        A summarized DataFrame with the group, formatted metric value,
-        and sample size (`n_{analysis_level}`).
+        One row per group, sorted by group, with float columns 'mean',
+        'ci_lower' and 'ci_upper' (NaN when n <= 1) and integer column 'n'.
     """
 
     # Step 1: Filter data to appropriate level
@@ -75,7 +67,7 @@ def analyze_grouped_metric(
         values = group_df[metric_col]
         n = len(values)
         mean = values.mean()
-        ci_lower = ci_upper = None
+        ci_lower = ci_upper = np.nan
 
         if n > 1:
             std = values.std(ddof=1)
@@ -86,13 +78,106 @@ def analyze_grouped_metric(
             ci_upper = mean + margin
 
         result_rows.append({
-            'group': group_val,
-            'mean': mean,
+            group_col: group_val,
+            'mean': float(mean),
             'n': n,
-            'ci_lower': ci_lower,
-            'ci_upper': ci_upper
+            'ci_lower': float(ci_lower),
+            'ci_upper': float(ci_upper)
         })
 
+    return pd.DataFrame(result_rows, columns=[group_col, 'mean', 'n', 'ci_lower', 'ci_upper'])
+
+
+def analyze_grouped_metric(
+    df: pd.DataFrame,
+    group_col: str,
+    metric_col: str,
+    analysis_level: str,
+    binary_condition=None,
+    confidence: float=0.95,
+    special_formatting=False
+):
+    """
+    Analyze and summarize a metric by group, with optional confidence intervals.
+
+    This function groups a DataFrame by a specified column and calculates the mean
+    of a target metric. It optionally converts values to binary using a condition,
+    calculates confidence intervals, and formats the results for presentation.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The input DataFrame containing raw data.
+
+    group_col : str
+        Column name to group the data by (e.g., 'context-level', 'category').
+
+    metric_col : str
+        Name of the numeric column to be analyzed.
+
+    analysis_level : str
+        analysis_level of analysis: one of 'action', 'response', or 'scenario'.
+        Used for determining deduplication and labeling in the output.
+
+    binary_condition : callable, optional
+        A function that returns True for "positive" binary values (e.g., `lambda x: x == 'Yes'`).
+        If provided, metric values are converted to 0 or 1.
+
+    confidence : float, default=0.95
+        Confidence level for computing confidence intervals (only used when n > 1).
+
+    special_formatting : str or bool, default=False
+        Optional output formatting style. Supported:
+        - 'percentage': Format mean as a percentage
+        - 'zero-to-five': Show mean and CI in 0–5 scale with interval in parentheses
+
+    Returns
+    -------
+    pandas.DataFrame
+        A summarized DataFrame with the group, formatted metric value,
+        and sample size (`n_{analysis_level}`).
+    """
+
+    summary = compute_grouped_metric(
+        df,
+        group_col=group_col,
+        metric_col=metric_col,
+        analysis_level=analysis_level,
+        binary_condition=binary_condition,
+        confidence=confidence,
+    )
+    return format_grouped_metric(summary, group_col, metric_col, analysis_level, special_formatting)
+
+
+def format_grouped_metric(
+    summary: pd.DataFrame,
+    group_col: str,
+    metric_col: str,
+    analysis_level: str,
+    special_formatting=False
+):
+    """
+    Format the output of `compute_grouped_metric` for presentation.
+
+    Parameters
+    ----------
+    summary : pandas.DataFrame
+        Columns: group_col, 'mean', 'n', 'ci_lower', 'ci_upper'.
+
+    group_col, metric_col, analysis_level, special_formatting
+        As in `analyze_grouped_metric`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The summarized DataFrame returned by `analyze_grouped_metric`.
+    """
+
+    result_rows = summary.rename(columns={group_col: 'group'}).to_dict('records')
+    for row in result_rows:
+        if row['n'] <= 1:
+            row['ci_lower'] = row['ci_upper'] = None
+
     # Step 4: Format values for presentation
     all_n_one_or_less = all(row['n'] <= 1 for row in result_rows)
     all_n_more_than_one = all(row['n'] > 1 for row in result_rows)
@@ -0,0 +1,336 @@
+import json
+import re
+from pathlib import Path
+
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+
+# Note column -> (analysis level, key columns, score columns reported with a hit)
+NOTE_FIELDS = {
+    'sheet_notes':     ('scenario', ['scenario'],                                  ['success', 'tree_depth', 'num_branches']),
+    'reasoning_notes': ('response', ['scenario', 'response_id'],                   ['reasoning_quality', 'reasoning_hallucination']),
+    'action_notes':    ('action',   ['scenario', 'response_id', 'action_name'],    ['usefulness', 'actionability', 'duplicate', 'action_hallucination', 'relevant']),
+}
+
+INDEX_VERSION = 2
+
+
+def tokenize(text) -> list:
+    """
+    Split a note into lowercase word tokens.
+
+    Parameters
+    ----------
+    text : str or None
+        The note text. Missing values yield no tokens.
+
+    Returns
+    -------
+    list[str]
+        Tokens in the order they appear in the text.
+    """
+    if not isinstance(text, str):
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _clean(value):
+    """
+    Convert a cell value into something JSON can store.
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    # Integer columns become float when a cell is empty; store 2.0 as 2
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _matches(value, wanted) -> bool:
+    """
+    Compare a stored value with a filter given on the command line, as
+    numbers when both sides are numeric (so 2.0 matches '2').
+    """
+    numbers = pd.to_numeric(pd.Series([value, wanted], dtype=object), errors='coerce')
+    if numbers.notna().all():
+        return numbers[0] == numbers[1]
+    return str(value) == str(wanted)
+
+
+def build_notes_index(df: pd.DataFrame, source=None) -> dict:
+    """
+    Tokenize every evaluator note once and build a positional inverted index.
+
+    Each distinct note becomes one document, keyed by scenario, response_id
+    and action_name depending on the level the note was written at. Sheet
+    notes are repeated on every row of the flattened frame, so documents are
+    deduplicated on their key columns before indexing (action notes also on
+    the action's occurrence, as action names can repeat within a response).
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The flattened action/response/scenario DataFrame.
+
+    source : str or Path, optional
+        Path of the workbook the frame was loaded from. Stored with its
+        modification time so a stale index can be detected.
+
+    Returns
+    -------
+    dict
+        The index, with keys 'docs' (list of document metadata) and
+        'postings' (term -> list of [doc_id, [positions]]).
+    """
+    docs = []
+    postings = {}
+
+    for field, (level, key_cols, score_cols) in NOTE_FIELDS.items():
+        if field not in df.columns:
+            continue
+
+        meta_cols = key_cols + [c for c in ['category', 'context-level'] if c not in key_cols]
+        available_scores = [c for c in score_cols if c in df.columns]
+        notes = df[meta_cols + available_scores + [field]]
+        dedup_cols = key_cols
+        if level == 'action':
+            # Action names are free text and may repeat within a response; every action row is its own note
+            notes = notes.assign(_occurrence=df.groupby(key_cols, sort=False).cumcount())
+            dedup_cols = key_cols + ['_occurrence']
+        notes = notes.drop_duplicates(subset=dedup_cols)
+        notes = notes[notes[field].notna()]
+
+        for row in notes.itertuples(index=False):
+            record = dict(zip(notes.columns, row))
+            tokens = tokenize(record[field])
+            if not tokens:
+                continue
+
+            doc_id = len(docs)
+            docs.append({
+                'field': field,
+                'level': level,
+                'scenario': _clean(record['scenario']),
+                'response_id': _clean(record.get('response_id')),
+                'action_name': _clean(record.get('action_name')),
+                'category': _clean(record.get('category')),
+                'context-level': _clean(record.get('context-level')),
+                'note': record[field],
+                'scores': {c: _clean(record[c]) for c in available_scores},
+            })
+
+            positions = {}
+            for pos, token in enumerate(tokens):
+                positions.setdefault(token, []).append(pos)
+            for token, token_positions in positions.items():
+                postings.setdefault(token, []).append([doc_id, token_positions])
+
+    source_info = None
+    if source is not None:
+        source = Path(source)
+        source_info = {'path': str(source.resolve()), 'mtime': source.stat().st_mtime}
+
+    return {
+        'version': INDEX_VERSION,
+        'source': source_info,
+        'docs': docs,
+        'postings': postings,
+    }
+
+
+def save_index(index: dict, path):
+    """
+    Write the index to disk as JSON.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+
+
+def load_index(path) -> dict:
+    """
+    Read an index previously written with `save_index`.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def index_is_current(index: dict, source) -> bool:
+    """
+    Check whether an index was built from the current version of a workbook.
+    """
+    info = index.get('source')
+    if index.get('version') != INDEX_VERSION or not info:
+        return False
+    source = Path(source)
+    return info['path'] == str(source.resolve()) and info['mtime'] == source.stat().st_mtime
+
+
+def _tokenize_query(query: str) -> list:
+    """
+    Split a query into phrase, operator, parenthesis and term tokens.
+    """
+    tokens = []
+    for match in re.finditer(r'"([^"]*)"|(\()|(\))|([^\s()"]+)', query):
+        phrase, lparen, rparen, word = match.groups()
+        if phrase is not None:
+            tokens.append(('PHRASE', tokenize(phrase)))
+        elif lparen:
+            tokens.append(('(', None))
+        elif rparen:
+            tokens.append((')', None))
+        elif word in ('AND', 'OR', 'NOT'):
+            tokens.append((word, None))
+        else:
+            # A bare word may itself contain punctuation, e.g. "ssh-keygen"
+            words = tokenize(word)
+            if len(words) == 1:
+                tokens.append(('TERM', words[0]))
+            elif words:
+                tokens.append(('PHRASE', words))
+    return tokens
+
+
+class _QueryEvaluator:
+    """
+    Recursive-descent evaluator for boolean note queries.
+
+    Grammar (adjacent operands are combined with an implicit AND)::
+
+        expr   := and ('OR' and)*
+        and    := not (['AND'] not)*
+        not    := 'NOT' not | atom
+        atom   := TERM | PHRASE | '(' expr ')'
+    """
+
+    def __init__(self, index: dict, tokens: list):
+        self.postings = index['postings']
+        self.universe = set(range(len(index['docs'])))
+        self.tokens = tokens
+        self.pos = 0
+
+    def _peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self) -> set:
+        if not self.tokens:
+            return set()
+        result = self._expr()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected token in query at position {self.pos}.")
+        return result
+
+    def _expr(self):
+        result = self._and()
+        while self._peek() == 'OR':
+            self._next()
+            result = result | self._and()
+        return result
+
+    def _and(self):
+        result = self._not()
+        while self._peek() in ('AND', 'NOT', 'TERM', 'PHRASE', '('):
+            if self._peek() == 'AND':
+                self._next()
+            result = result & self._not()
+        return result
+
+    def _not(self):
+        if self._peek() == 'NOT':
+            self._next()
+            return self.universe - self._not()
+        return self._atom()
+
+    def _atom(self):
+        kind = self._peek()
+        if kind is None:
+            raise ValueError("Unexpected end of query.")
+        kind, value = self._next()
+        if kind == 'TERM':
+            return {doc_id for doc_id, _ in self.postings.get(value, [])}
+        if kind == 'PHRASE':
+            return self._phrase(value)
+        if kind == '(':
+            result = self._expr()
+            if self._peek() != ')':
+                raise ValueError("Missing closing parenthesis in query.")
+            self._next()
+            return result
+        raise ValueError(f"Unexpected '{kind}' in query.")
+
+    def _phrase(self, words):
+        if not words:
+            return set()
+        positions = [dict((d, set(p)) for d, p in self.postings.get(w, [])) for w in words]
+        candidates = set(positions[0])
+        for word_positions in positions[1:]:
+            candidates &= set(word_positions)
+
+        matches = set()
+        for doc_id in candidates:
+            for start in positions[0][doc_id]:
+                if all(start + i in positions[i][doc_id] for i in range(1, len(words))):
+                    matches.add(doc_id)
+                    break
+        return matches
+
+
+def search_notes(
+    index: dict,
+    query: str,
+    category=None,
+    context_level=None,
+) -> pd.DataFrame:
+    """
+    Run a term, phrase or boolean query against the notes index.
+
+    Queries support bare terms, quoted phrases, AND / OR / NOT and
+    parentheses. Adjacent terms are combined with AND.
+
+    Parameters
+    ----------
+    index : dict
+        An index produced by `build_notes_index` or `load_index`.
+
+    query : str
+        The query, e.g. ``'"privilege escalation" OR (nmap NOT duplicate)'``.
+
+    category : str, optional
+        Only return hits from scenarios in this finding category.
+
+    context_level : str or int, optional
+        Only return hits from scenarios at this context level.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per matching note with its keys, the note text and the
+        scores recorded alongside it.
+    """
+    doc_ids = _QueryEvaluator(index, _tokenize_query(query)).parse()
+
+    rows = []
+    for doc_id in sorted(doc_ids):
+        doc = index['docs'][doc_id]
+        if category is not None and not _matches(doc['category'], category):
+            continue
+        if context_level is not None and not _matches(doc['context-level'], context_level):
+            continue
+        row = {k: v for k, v in doc.items() if k != 'scores'}
+        row.update(doc['scores'])
+        rows.append(row)
+
+    columns = ['scenario', 'response_id', 'action_name', 'field', 'category', 'context-level', 'note']
+    hits = pd.DataFrame(rows, columns=None if rows else columns)
+    if rows:
+        hits = hits[columns + [c for c in hits.columns if c not in columns and c != 'level']]
+    return hits
@@ -0,0 +1,342 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .analyze import METRICS, LEVEL_KEYS, metric_values
+from .variance import LEVEL_CLUSTERS
+from .correlations import rollup_level
+
+# Upper bound on simulated values held in memory at once
+BATCH_VALUES = 2_000_000
+
+
+def _metric_spec(metric_col: str):
+    """
+    Analysis level and binary condition of a metric from `METRICS`.
+    """
+    for col, level, condition, _ in METRICS:
+        if col == metric_col:
+            return level, condition
+    raise ValueError(f"Unknown metric: '{metric_col}'.")
+
+
+class _HierarchySampler:
+    """
+    Vectorized hierarchical resampling of the observed data: scenarios are
+    drawn with replacement, then responses within each drawn scenario, then
+    actions within each drawn response. This keeps both the observed
+    distribution of the metric and its clustering.
+    """
+
+    def __init__(self, df: pd.DataFrame, metric_col: str):
+        level, condition = _metric_spec(metric_col)
+        self.binary = condition is not None
+        clusters = LEVEL_CLUSTERS[level]
+
+        data = df[list(dict.fromkeys(['scenario', 'response_id', metric_col]))]
+        if LEVEL_KEYS[level] is not None:
+            data = data.drop_duplicates(subset=LEVEL_KEYS[level])
+        data = data.assign(**{metric_col: metric_values(data[metric_col], condition)})
+        data = data[data[metric_col].notna()]
+        if data.empty:
+            raise ValueError(f"No values to simulate for '{metric_col}'.")
+
+        # Sort units so that every cluster is a contiguous slice
+        codes = [pd.factorize(data[c], sort=True)[0] for c in clusters]
+        order = np.lexsort(codes[::-1]) if codes else np.arange(len(data))
+        self.values = data[metric_col].to_numpy(dtype=float)[order]
+        codes = [c[order] for c in codes]
+
+        self.levels = []
+        if len(codes) == 2:
+            # Renumber responses so they are contiguous within scenarios
+            changes = (np.diff(codes[0]) != 0) | (np.diff(codes[1]) != 0)
+            response = np.r_[0, np.cumsum(changes)]
+            scenario_of_response = codes[0][np.r_[0, np.flatnonzero(np.diff(response)) + 1]]
+            self.levels.append(self._csr(scenario_of_response))
+            self.levels.append(self._csr(response))
+        elif len(codes) == 1:
+            self.levels.append(self._csr(codes[0]))
+
+        self.n_top = len(self.levels[0][0]) if self.levels else len(self.values)
+        self.mean = self.values.mean()
+
+    @staticmethod
+    def _csr(sorted_codes):
+        counts = np.bincount(sorted_codes)
+        return np.cumsum(counts) - counts, counts
+
+    def sample(self, rng, n_reps: int, n_scenarios: int, sizes: list) -> np.ndarray:
+        """
+        Draw `n_reps` datasets of `n_scenarios` scenarios.
+
+        Parameters
+        ----------
+        sizes : list[int]
+            Units drawn inside each cluster level, e.g.
+            [responses per scenario, actions per response].
+
+        Returns
+        -------
+        np.ndarray
+            (n_reps, n_scenarios, units per scenario) array of metric values.
+        """
+        index = rng.integers(0, self.n_top, size=(n_reps, n_scenarios))
+        for (offsets, counts), size in zip(self.levels, sizes):
+            # A random cyclic window inside each cluster: units repeat only
+            # when more are requested than the cluster has, so resampling does
+            # not add within-cluster correlation of its own
+            cluster_counts = counts[index][..., None]
+            position = rng.integers(0, cluster_counts) + np.arange(size)
+            if size > counts.min():
+                position %= cluster_counts
+            else:
+                position -= cluster_counts * (position >= cluster_counts)
+            index = offsets[index][..., None] + position
+        return self.values[index].reshape(n_reps, n_scenarios, -1)
+
+    def apply_effect(self, rng, values: np.ndarray, effect: float) -> np.ndarray:
+        """
+        Shift the simulated values by `effect`. Binary metrics keep their
+        0/1 support: units are flipped at random so the expected rate moves
+        by `effect`.
+        """
+        if not self.binary:
+            return values + effect
+        if effect >= 0:
+            flip_probability = min(effect / max(1 - self.mean, 1e-12), 1.0)
+            return np.where((values == 0) & (rng.random(values.shape) < flip_probability), 1.0, values)
+        flip_probability = min(-effect / max(self.mean, 1e-12), 1.0)
+        return np.where((values == 1) & (rng.random(values.shape) < flip_probability), 0.0, values)
+
+
+def _welch_p_values(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Two-sided Welch t-test p-values along the last axis, for every replicate at once.
+    """
+    n_a, n_b = a.shape[-1], b.shape[-1]
+    var_a = a.var(axis=-1, ddof=1) / n_a
+    var_b = b.var(axis=-1, ddof=1) / n_b
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (b.mean(axis=-1) - a.mean(axis=-1)) / np.sqrt(var_a + var_b)
+        dof = (var_a + var_b) ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+    p = 2 * stats.t.sf(np.abs(t), dof)
+    # Degenerate replicates (no variance in either arm) reject only if the means differ
+    degenerate = (var_a + var_b) == 0
+    return np.where(degenerate, np.where(a.mean(axis=-1) == b.mean(axis=-1), 1.0, 0.0), p)
+
+
+def simulate_metric_power(
+    df: pd.DataFrame,
+    metric_col: str,
+    effects,
+    n_scenarios,
+    responses_per_scenario=None,
+    actions_per_response=None,
+    n_sims: int=2000,
+    alpha: float=0.05,
+    seed=None,
+) -> pd.DataFrame:
+    """
+    Monte Carlo power of detecting a difference in a metric between two
+    equally sized groups of scenarios.
+
+    Both groups are resampled from the observed data with its scenario /
+    response / action structure, and the effect is added to the second.
+    Two tests are evaluated on every replicate:
+
+    - 'power_unit': Welch t-test on the individual units, which treats them as
+      independent like the intervals of `analyze_grouped_metric`.
+    - 'power_scenario': Welch t-test on scenario means, which respects the
+      clustering.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The flattened action/response/scenario DataFrame.
+
+    metric_col : str
+        A metric from `METRICS`.
+
+    effects : list[float]
+        Hypothesized differences in the mean (for Y/N metrics, in the rate;
+        effects that would move the observed rate outside [0, 1] raise a
+        ValueError).
+
+    n_scenarios : list[int]
+        Candidate numbers of scenarios per group.
+
+    responses_per_scenario, actions_per_response : int, optional
+        Units drawn per cluster. Default to the observed medians.
+
+    n_sims : int, default=2000
+        Replicates per design.
+
+    alpha : float, default=0.05
+        Significance level.
+
+    seed : int, optional
+        Seed for the simulation.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per (effect, n_scenarios) with the number of units per
+        group and both powers.
+    """
+    sampler = _HierarchySampler(df, metric_col)
+    rng = np.random.default_rng(seed)
+
+    if sampler.binary:
+        # A rate cannot be moved outside [0, 1]
+        unreachable = [effect for effect in effects if not 0 <= sampler.mean + effect <= 1]
+        if unreachable:
+            raise ValueError(
+                f"Effects {unreachable} move the observed rate of '{metric_col}' "
+                f"({sampler.mean:.3f}) outside [0, 1]."
+            )
+
+    level, _ = _metric_spec(metric_col)
+    if responses_per_scenario is None:
+        responses_per_scenario = int(df.groupby('scenario')['response_id'].nunique().median())
+    if actions_per_response is None:
+        actions_per_response = int(df.groupby('response_id').size().median())
+    sizes = [responses_per_scenario, actions_per_response][:len(sampler.levels)]
+    units_per_scenario = int(np.prod(sizes)) if sizes else 1
+
+    rows = []
+    for n in n_scenarios:
+        batch = max(1, BATCH_VALUES // (2 * n * units_per_scenario))
+        rejections_unit = np.zeros(len(effects))
+        rejections_scenario = np.zeros(len(effects))
+        done = 0
+        while done < n_sims:
+            reps = min(batch, n_sims - done)
+            control = sampler.sample(rng, reps, n, sizes)
+            base = sampler.sample(rng, reps, n, sizes)
+
+            # The same simulated datasets are reused for every effect
+            for i, effect in enumerate(effects):
+                treated = sampler.apply_effect(rng, base, effect)
+                rejections_unit[i] += (_welch_p_values(control.reshape(reps, -1), treated.reshape(reps, -1)) < alpha).sum()
+                if n > 1:
+                    rejections_scenario[i] += (_welch_p_values(control.mean(axis=2), treated.mean(axis=2)) < alpha).sum()
+            done += reps
+
+        for i, effect in enumerate(effects):
+            rows.append({
+                'metric': metric_col,
+                'level': level,
+                'effect': effect,
+                'n_scenarios': n,
+                'n_units': n * units_per_scenario,
+                'power_unit': rejections_unit[i] / n_sims,
+                'power_scenario': rejections_scenario[i] / n_sims if n > 1 else np.nan,
+            })
+
+    return pd.DataFrame(rows).sort_values(['effect', 'n_scenarios'], kind='stable').reset_index(drop=True)
+
+
+def simulate_correlation_power(
+    df: pd.DataFrame,
+    column1: str,
+    column2: str,
+    correlations,
+    sample_sizes,
+    level: str='action',
+    n_sims: int=2000,
+    alpha: float=0.05,
+    seed=None,
+) -> pd.DataFrame:
+    """
+    Monte Carlo power of the Pearson test in `calculate_correlation_with_p`.
+
+    Pairs are drawn from a Gaussian copula with the hypothesized latent
+    correlation and mapped onto the observed marginal distribution of each
+    column at the given level, so ties and bounded scales are reproduced.
+    Pearson's r and its p-value are computed for all replicates at once.
+
+    The pairs are drawn independently of each other: the sample sizes are
+    numbers of independent units at `level`. Clustering of actions within
+    responses or scenarios is not simulated, so at the action level the
+    power is optimistic when the units are clustered.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The (possibly enriched) flattened DataFrame.
+
+    column1, column2 : str
+        Columns to correlate. Y/N metrics from `METRICS` are converted to 0/1.
+
+    correlations : list[float]
+        Hypothesized latent correlations.
+
+    sample_sizes : list[int]
+        Candidate numbers of paired observations (units at `level`).
+
+    level : str, default='action'
+        Level at which the columns are correlated: 'action', 'response' or
+        'scenario'. The marginals are taken from `rollup_level`, so
+        response-level columns count once per response.
+
+    n_sims, alpha, seed
+        As in `simulate_metric_power`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per (correlation, n) with the mean simulated r and the power.
+    """
+    rng = np.random.default_rng(seed)
+
+    marginals = []
+    for col in (column1, column2):
+        condition = None
+        if col in {m[0] for m in METRICS}:
+            condition = _metric_spec(col)[1]
+        data = df[[c for c in ['scenario', 'response_id'] if c in df.columns]].assign(**{col: metric_values(df[col], condition)})
+        values = rollup_level(data, [col], level=level)[col].dropna().to_numpy(dtype=float)
+        if len(values) == 0:
+            raise ValueError(f"No values to simulate for '{col}'.")
+        marginals.append(np.sort(values))
+
+    rows = []
+    for rho in correlations:
+        for n in sample_sizes:
+            batch = max(1, BATCH_VALUES // (2 * n))
+            rejections = 0
+            r_total = 0.0
+            done = 0
+            while done < n_sims:
+                reps = min(batch, n_sims - done)
+                z1 = rng.standard_normal((reps, n))
+                z2 = rho * z1 + np.sqrt(1 - rho ** 2) * rng.standard_normal((reps, n))
+
+                # Inverse empirical CDF of each observed column
+                x = marginals[0][np.minimum((stats.norm.cdf(z1) * len(marginals[0])).astype(np.int64), len(marginals[0]) - 1)]
+                y = marginals[1][np.minimum((stats.norm.cdf(z2) * len(marginals[1])).astype(np.int64), len(marginals[1]) - 1)]
+
+                xc = x - x.mean(axis=1, keepdims=True)
+                yc = y - y.mean(axis=1, keepdims=True)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    r = (xc * yc).sum(axis=1) / np.sqrt((xc ** 2).sum(axis=1) * (yc ** 2).sum(axis=1))
+                    r = np.clip(r, -1.0, 1.0)
+                    t = r * np.sqrt((n - 2) / (1 - r ** 2))
+                p = 2 * stats.t.sf(np.abs(t), n - 2)
+
+                rejections += (p < alpha).sum()
+                r_total += np.nansum(r)
+                done += reps
+
+            rows.append({
+                'column1': column1,
+                'column2': column2,
+                'level': level,
+                'correlation': rho,
+                'n': n,
+                'mean_r': r_total / n_sims,
+                'power': rejections / n_sims,
+            })
+
+    return pd.DataFrame(rows)
@@ -59,3 +59,52 @@ def present_analysis_tables(group_results: dict[str,pd.DataFrame]) -> dict:
         final_dfs[group_name]['response'].drop(columns='Num Responses', inplace=True, errors='ignore')
 
     return final_dfs
+
+def present_variance_tables(decomposition: pd.DataFrame, design_effects: pd.DataFrame) -> dict:
+    """
+    Format the variance decomposition and the design-effect-adjusted intervals
+    for export.
+
+    Parameters
+    ----------
+    decomposition : pd.DataFrame
+        Output of `variance_decomposition`.
+
+    design_effects : pd.DataFrame
+        Output of `analyze_design_effects`.
+
+    Returns
+    -------
+    dict[str, dict[str, pd.DataFrame]]
+        {'Variance': {'decomposition': ..., 'design_effects': ...}}, in the
+        same nested layout as `present_analysis_tables`.
+    """
+    def title(df):
+        df.columns = [col.replace('_', ' ').title() for col in df.columns]
+        return df
+
+    decomposition = decomposition.copy()
+    for col in ['var_scenario', 'var_response', 'var_residual', 'icc_scenario', 'icc_response', 'design_effect']:
+        decomposition[col] = decomposition[col].map(lambda x: '-' if pd.isna(x) else f"{x:.3f}")
+
+    effects = design_effects.copy()
+    effects['ci'] = [
+        '-' if pd.isna(lo) else f"[{lo:.2f}, {hi:.2f}]"
+        for lo, hi in zip(effects['ci_lower'], effects['ci_upper'])
+    ]
+    effects['adjusted_ci'] = [
+        '-' if pd.isna(lo) else f"[{lo:.2f}, {hi:.2f}]"
+        for lo, hi in zip(effects['adj_ci_lower'], effects['adj_ci_upper'])
+    ]
+    effects['mean'] = effects['mean'].map(lambda x: f"{x:.2f}")
+    effects['design_effect'] = effects['design_effect'].map(lambda x: f"{x:.2f}")
+    # Blank cells are not counted, unlike in the main tables
+    effects = effects.rename(columns={'n': 'n_scored'})
+    effects = effects[['group_col', 'group', 'metric', 'mean', 'n_scored', 'design_effect', 'ci', 'adjusted_ci']]
+
+    return {
+        'Variance': {
+            'decomposition': title(decomposition),
+            'design_effects': title(effects),
+        }
+    }
@@ -0,0 +1,279 @@
+import asyncio
+import json
+from collections import OrderedDict
+from functools import partial
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from .analyze import METRICS
+from .agreement import analyze_agreement
+
+# Query parameters that are not column filters
+RESERVED_PARAMS = {'group', 'metric'}
+
+# Number of computed responses kept in memory
+CACHE_SIZE = 256
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def _records(df: pd.DataFrame) -> list:
+    """
+    DataFrame rows as JSON-ready dicts, with missing values as None.
+    """
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisServer:
+    """
+    Local HTTP/JSON server over an `Analysis` that is loaded once and kept in
+    memory.
+
+    Requests are parsed on the event loop; the pandas work behind each
+    endpoint runs in the loop's default executor so that a slow request does
+    not block the others. Encoded results are memoized per path and query,
+    since the underlying data does not change while the server runs.
+
+    Endpoints (GET)
+    ---------------
+    /health
+        Row and scenario counts.
+    /metrics?group=<col>[&metric=<metric>][&<col>=<value>...]
+        Numeric grouped metrics; without `metric`, every metric in `METRICS`.
+        Any other parameter filters the rows on a column before they are
+        deduplicated to the metric's level and grouped.
+    /correlations
+        Correlation results.
+    /variance
+        Variance decomposition per metric.
+    /scenarios, /scenarios/<name>
+        Scenario names, or one scenario with its responses and actions.
+    /agreement
+        Inter-rater agreement, when rater workbooks were given.
+
+    Parameters
+    ----------
+    analysis : Analysis
+        The analysis to serve. Database-dependent results, including the
+        enriched DataFrame that metrics can be grouped and filtered by, are
+        computed before the server starts. With `engine='sql'`, /metrics is
+        computed by the analysis' SQL engine.
+
+    rater_frames : dict[str, pd.DataFrame], optional
+        Flattened workbooks of other evaluators, for /agreement.
+    """
+
+    def __init__(self, analysis, rater_frames=None):
+        self.analysis = analysis
+        self.df = analysis.enriched_df
+        self.rater_frames = rater_frames
+        self.metrics = {m[0]: m for m in METRICS}
+        self._cache = OrderedDict()
+
+        # Everything that needs the database is loaded up front, on this thread
+        self.correlations = analysis.correlations
+        analysis.variance_decomposition
+        if analysis.engine == 'sql':
+            analysis.sql_engine
+
+        self.routes = {
+            'health': self._health,
+            'metrics': self._metrics,
+            'correlations': self._correlations,
+            'variance': self._variance,
+            'scenarios': self._scenarios,
+            'agreement': self._agreement,
+        }
+
+    def _health(self, params, args):
+        return {
+            'status': 'ok',
+            'rows': len(self.df),
+            'scenarios': int(self.df['scenario'].nunique()),
+        }
+
+    def _filters(self, params) -> dict:
+        """
+        Filter parameters with their values converted to the column's type,
+        so that e.g. context-level=2 matches 2.0 in a float column.
+        """
+        filters = {}
+        for col, value in params.items():
+            if col in RESERVED_PARAMS:
+                continue
+            if col not in self.df.columns:
+                if self.analysis.engine != 'sql':
+                    raise HttpError(400, f"Unknown filter column: '{col}'.")
+                # Columns only the SQL engine knows about; it validates them
+                try:
+                    filters[col] = float(value)
+                except ValueError:
+                    filters[col] = value
+            elif pd.api.types.is_numeric_dtype(self.df[col]):
+                try:
+                    filters[col] = float(value)
+                except ValueError:
+                    raise HttpError(400, f"Invalid value for '{col}': '{value}'.")
+            else:
+                filters[col] = value
+        return filters
+
+    def _metrics(self, params, args):
+        group_col = params.get('group')
+        if group_col is None:
+            raise HttpError(400, "Missing 'group' parameter.")
+        if group_col not in self.df.columns and self.analysis.engine != 'sql':
+            raise HttpError(400, f"Unknown group column: '{group_col}'.")
+
+        metric_cols = [params['metric']] if 'metric' in params else list(self.metrics)
+        for metric_col in metric_cols:
+            if metric_col not in self.metrics:
+                raise HttpError(400, f"Unknown metric: '{metric_col}'.")
+        filters = self._filters(params)
+
+        tables = []
+        for metric_col in metric_cols:
+            level = self.metrics[metric_col][1]
+            try:
+                # Memoized by the analysis; filtered rows are deduplicated to the metric's level after filtering
+                table = self.analysis.grouped_metric(group_col, metric_col, filters)
+            except ValueError as e:
+                raise HttpError(400, str(e))
+            tables.append(table.rename(columns={group_col: 'group'}).assign(metric=metric_col, level=level))
+
+        result = pd.concat(tables, ignore_index=True)
+        return _records(result[['group', 'metric', 'level', 'mean', 'n', 'ci_lower', 'ci_upper']])
+
+    def _correlations(self, params, args):
+        return _records(self.correlations)
+
+    def _variance(self, params, args):
+        return _records(self.analysis.variance_decomposition)
+
+    def _scenarios(self, params, args):
+        if not args:
+            return sorted(self.df['scenario'].unique().tolist())
+
+        name = args[0]
+        rows = self.df[self.df['scenario'] == name]
+        if rows.empty:
+            raise HttpError(404, f"Unknown scenario: '{name}'.")
+
+        scenario_cols = ['scenario', 'finding_number', 'context-level', 'tree_depth', 'num_branches',
+                         'num_responses', 'success', 'category', 'sheet_notes']
+        response_cols = ['response_id', 'reasoning_quality', 'reasoning_notes', 'reasoning_hallucination']
+        action_cols = ['action_name', 'usefulness', 'actionability', 'duplicate',
+                       'action_hallucination', 'relevant', 'action_notes']
+
+        details = _records(rows[scenario_cols].head(1))[0]
+        details['responses'] = []
+        for response_id, response_rows in rows.groupby('response_id', sort=False):
+            response = _records(response_rows[response_cols].head(1))[0]
+            response['actions'] = _records(response_rows[action_cols])
+            details['responses'].append(response)
+        return details
+
+    def _agreement(self, params, args):
+        if not self.rater_frames:
+            raise HttpError(404, "No rater workbooks were loaded.")
+        frames = {'main': self.analysis.df, **self.rater_frames}
+        return _records(analyze_agreement(frames, seed=0))
+
+    def compute(self, path: str, params: dict) -> bytes:
+        """
+        Route a request and compute its encoded JSON result (runs in the executor).
+        """
+        parts = [unquote(part) for part in path.strip('/').split('/') if part]
+        route = self.routes.get(parts[0] if parts else 'health')
+        if route is None:
+            raise HttpError(404, f"Unknown endpoint: '{path}'.")
+        return json.dumps(route(params, parts[1:]), default=_json_default).encode('utf-8')
+
+    async def respond(self, path: str, params: dict) -> bytes:
+        """
+        Encoded result of a request. Concurrent identical requests share the
+        computation of the first one; failed computations are not cached.
+        """
+        key = (path, tuple(sorted(params.items())))
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, partial(self.compute, path, params))
+            self._cache[key] = future
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            if self._cache.get(key) is future:
+                del self._cache[key]
+            raise
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve one HTTP request on a connection.
+        """
+        status = 200
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            # Skip the headers; requests have no body
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            if len(request_line) < 2:
+                raise HttpError(400, "Malformed request line.")
+            method, target = request_line[0], request_line[1]
+            if method != 'GET':
+                raise HttpError(405, f"Method {method} is not supported.")
+
+            url = urlsplit(target)
+            payload = await self.respond(url.path, dict(parse_qsl(url.query)))
+        except HttpError as e:
+            status, payload = e.status, json.dumps({'error': str(e)}).encode('utf-8')
+        except Exception as e:
+            status, payload = 500, json.dumps({'error': str(e)}).encode('utf-8')
+
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n".encode('latin-1') + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def serve(analysis, host='127.0.0.1', port=8000, rater_frames=None):
+    """
+    Load the analysis once and serve it until interrupted.
+    """
+    server = AnalysisServer(analysis, rater_frames=rater_frames)
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
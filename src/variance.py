@@ -0,0 +1,320 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .analyze import GROUP_COLS, METRICS, LEVEL_KEYS, LEVEL_UNIT_COLS, metric_values
+
+# Cluster columns above each analysis level, from the outermost inwards
+LEVEL_CLUSTERS = {level: cols[:-1] for level, cols in LEVEL_UNIT_COLS.items()}
+
+
+def _encode_keys(df: pd.DataFrame) -> dict:
+    """
+    Factorize the cluster and grouping columns once.
+
+    Returns
+    -------
+    dict[str, tuple[np.ndarray, pd.Index]]
+        Integer codes and sorted unique labels for each key column.
+    """
+    key_cols = dict.fromkeys(['scenario', 'response_id'] + GROUP_COLS)
+    return {c: pd.factorize(df[c], sort=True) for c in key_cols}
+
+
+def _level_values(df: pd.DataFrame, keys: dict, metric_col: str, level: str, binary_condition=None):
+    """
+    Select one unit per row at the metric's analysis level.
+
+    Returns
+    -------
+    tuple[np.ndarray, dict[str, np.ndarray]]
+        The metric as floats and the integer codes of every key column for
+        the selected units. Units with a missing metric are dropped.
+    """
+    if LEVEL_KEYS[level] is not None:
+        # Keep the first row of each unit, as drop_duplicates would
+        first = ~pd.Series(keys[LEVEL_KEYS[level]][0]).duplicated().to_numpy()
+        rows = np.flatnonzero(first)
+    else:
+        rows = np.arange(len(df))
+
+    y = metric_values(df[metric_col].iloc[rows], binary_condition).to_numpy()
+
+    keep = ~np.isnan(y)
+    return y[keep], {c: codes[rows][keep] for c, (codes, _) in keys.items()}
+
+
+def _sum_of_squares_between(y, codes, parent_means):
+    """
+    Sum over clusters of n_c * (cluster mean - parent mean)^2, with the
+    cluster counts, sums and means computed from `np.bincount`.
+    """
+    counts = np.bincount(codes).astype(float)
+    means = np.bincount(codes, weights=y) / counts
+    return counts, means, (counts * (means - parent_means) ** 2).sum()
+
+
+def variance_components(y: np.ndarray, cluster_codes: list) -> dict:
+    """
+    Estimate nested random-effect variance components with the ANOVA
+    (method of moments) estimators for unbalanced data.
+
+    Parameters
+    ----------
+    y : np.ndarray
+        Metric values, one per unit.
+
+    cluster_codes : list[np.ndarray]
+        Integer codes of the enclosing clusters, outermost first. Zero, one
+        or two levels are supported; inner clusters must be nested in the
+        outer ones.
+
+    Returns
+    -------
+    dict
+        'var_scenario', 'var_response' and 'var_residual' variance
+        components (NaN where a level does not apply), truncated at zero.
+    """
+    N = len(y)
+    result = {'var_scenario': np.nan, 'var_response': np.nan, 'var_residual': np.nan}
+    if N < 2:
+        return result
+
+    if not cluster_codes:
+        result['var_residual'] = y.var(ddof=1)
+        return result
+
+    outer = cluster_codes[0]
+    outer_counts, outer_means, ss_outer = _sum_of_squares_between(y, outer, y.mean())
+    a = len(outer_counts)
+
+    if len(cluster_codes) == 1:
+        ss_within = ((y - outer_means[outer]) ** 2).sum()
+        ms_within = ss_within / (N - a) if N > a else np.nan
+        ms_outer = ss_outer / (a - 1) if a > 1 else np.nan
+        n0 = (N - (outer_counts ** 2).sum() / N) / (a - 1) if a > 1 else np.nan
+
+        var_outer = max((ms_outer - ms_within) / n0, 0.0) if a > 1 else np.nan
+        result['var_scenario'] = var_outer
+        result['var_residual'] = ms_within
+        return result
+
+    inner = cluster_codes[1]
+    inner_counts = np.bincount(inner).astype(float)
+    inner_parent = np.zeros(len(inner_counts), dtype=np.int64)
+    inner_parent[inner] = outer
+    inner_means = np.bincount(inner, weights=y) / inner_counts
+    b = len(inner_counts)
+
+    ss_inner = (inner_counts * (inner_means - outer_means[inner_parent]) ** 2).sum()
+    ss_within = ((y - inner_means[inner]) ** 2).sum()
+
+    ms_within = ss_within / (N - b) if N > b else np.nan
+    ms_inner = ss_inner / (b - a) if b > a else np.nan
+    ms_outer = ss_outer / (a - 1) if a > 1 else np.nan
+
+    # Coefficients of the expected mean squares (Searle, unbalanced nested design)
+    inner_sq_by_outer = np.bincount(inner_parent, weights=inner_counts ** 2, minlength=a)
+    k1 = (N - (inner_sq_by_outer / outer_counts).sum()) / (b - a) if b > a else np.nan
+    k2 = ((inner_sq_by_outer / outer_counts).sum() - (inner_counts ** 2).sum() / N) / (a - 1) if a > 1 else np.nan
+    k3 = (N - (outer_counts ** 2).sum() / N) / (a - 1) if a > 1 else np.nan
+
+    var_inner = max((ms_inner - ms_within) / k1, 0.0) if b > a else 0.0
+    var_outer = max((ms_outer - ms_within - k2 * var_inner) / k3, 0.0) if a > 1 else np.nan
+
+    result['var_scenario'] = var_outer
+    result['var_response'] = var_inner
+    result['var_residual'] = ms_within
+    return result
+
+
+def variance_decomposition(df: pd.DataFrame, keys=None) -> pd.DataFrame:
+    """
+    Variance components, intraclass correlations and overall design effects
+    for every metric in `METRICS`.
+
+    Actions are nested in responses, which are nested in scenarios. The
+    scenario ICC is the share of variance between scenarios; the response
+    ICC is the correlation between two units of the same response, i.e. the
+    share of variance at the scenario and response levels together.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The flattened action/response/scenario DataFrame.
+
+    keys : dict, optional
+        Precomputed result of `_encode_keys`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per metric with columns 'metric', 'level', 'n', the three
+        variance components, 'icc_scenario', 'icc_response' and
+        'design_effect' (for the overall mean).
+    """
+    if keys is None:
+        keys = _encode_keys(df)
+    rows = []
+
+    for metric_col, level, condition, _ in METRICS:
+        y, unit_keys = _level_values(df, keys, metric_col, level, condition)
+        codes = [_compact(unit_keys[c]) for c in LEVEL_CLUSTERS[level]]
+
+        row = {'metric': metric_col, 'level': level, 'n': len(y)}
+        row.update(variance_components(y, codes))
+        row.update(_iccs(row))
+        rhos = _level_rhos(row['icc_scenario'], row['icc_response'], len(codes))
+        row['design_effect'] = _design_effects(np.zeros(len(y), dtype=np.int64), codes, rhos)[0] if len(y) else np.nan
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def _compact(codes: np.ndarray) -> np.ndarray:
+    """
+    Renumber integer codes (-1 for missing) to 0..k-1 so that bincount
+    sizes match the clusters actually present.
+    """
+    present = np.bincount(codes + 1) > 0
+    return (np.cumsum(present) - 1)[codes + 1]
+
+
+def _iccs(components: dict) -> dict:
+    """
+    Intraclass correlations from variance components.
+    """
+    parts = [components[k] for k in ('var_scenario', 'var_response', 'var_residual')]
+    total = np.nansum(parts)
+    if total <= 0:
+        return {'icc_scenario': np.nan, 'icc_response': np.nan}
+
+    var_scenario = components['var_scenario']
+    var_response = components['var_response']
+    icc_scenario = var_scenario / total if not np.isnan(var_scenario) else np.nan
+    icc_response = np.nansum([var_scenario, var_response]) / total if not np.isnan(var_response) else np.nan
+    return {'icc_scenario': icc_scenario, 'icc_response': icc_response}
+
+
+def _level_rhos(icc_scenario, icc_response, n_levels) -> list:
+    """
+    Share of the total variance at each cluster level, outermost first.
+    """
+    return [icc_scenario, icc_response - icc_scenario][:n_levels]
+
+
+def _design_effects(group_codes, cluster_codes, rhos) -> np.ndarray:
+    """
+    Design effect of each group mean:
+
+        deff_g = 1 + sum over cluster levels of (m_level - 1) * rho_level
+
+    where m is the size-weighted mean cluster size (sum n_c^2 / N_g) of the
+    clusters inside group g, computed with `np.bincount` for all groups at once.
+    """
+    if not len(group_codes):
+        return np.ones(0)
+    n_groups = group_codes.max() + 1
+    group_n = np.bincount(group_codes, minlength=n_groups).astype(float)
+    deff = np.ones(n_groups)
+
+    for codes, rho in zip(cluster_codes, rhos):
+        if np.isnan(rho):
+            continue
+        # Cells are (group, cluster) pairs; a cluster split across groups counts once per group
+        width = codes.max() + 1
+        cell_codes, cell_ids = pd.factorize(group_codes * width + codes)
+        cell_n = np.bincount(cell_codes).astype(float)
+        m = np.bincount(cell_ids // width, weights=cell_n ** 2, minlength=n_groups) / group_n
+        deff += (m - 1) * rho
+
+    return deff
+
+
+def analyze_design_effects(df: pd.DataFrame, confidence: float=0.95, decomposition=None) -> pd.DataFrame:
+    """
+    Design-effect-adjusted confidence intervals for every metric and grouping.
+
+    The unadjusted interval is a t-interval that treats units as
+    independent, like the one of `analyze_grouped_metric`, but units with a
+    missing metric are left out of 'n' here, whereas
+    `compute_grouped_metric` counts them. The adjusted
+    interval inflates its standard error by sqrt(design effect), using the
+    ICCs from `variance_decomposition` and the cluster sizes within each group.
+    When grouping by scenario, the between-scenario component is constant
+    within a group and is left out.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The flattened action/response/scenario DataFrame.
+
+    confidence : float, default=0.95
+        Confidence level for the intervals.
+
+    decomposition : pd.DataFrame, optional
+        A precomputed result of `variance_decomposition`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Long-form table with columns 'group_col', 'group', 'metric', 'level',
+        'mean', 'n' (units with a value), 'design_effect', 'n_effective', 'ci_lower', 'ci_upper',
+        'adj_ci_lower' and 'adj_ci_upper'.
+    """
+    keys = _encode_keys(df)
+    if decomposition is None:
+        decomposition = variance_decomposition(df, keys)
+    iccs = decomposition.set_index('metric')
+
+    tables = []
+    for metric_col, level, condition, _ in METRICS:
+        y, unit_keys = _level_values(df, keys, metric_col, level, condition)
+        if not len(y):
+            continue
+        icc_scenario = iccs.at[metric_col, 'icc_scenario']
+        icc_response = iccs.at[metric_col, 'icc_response']
+        all_cluster_codes = [_compact(unit_keys[c]) for c in LEVEL_CLUSTERS[level]]
+        all_rhos = _level_rhos(icc_scenario, icc_response, len(all_cluster_codes))
+
+        for group_col in GROUP_COLS:
+            # Units with a missing group label are left out, as in groupby
+            labelled = unit_keys[group_col] >= 0
+            group_keys = unit_keys[group_col][labelled]
+            group_codes = _compact(group_keys)
+            groups = keys[group_col][1][np.flatnonzero(np.bincount(group_keys) > 0)]
+            cluster_codes = [codes[labelled] for codes in all_cluster_codes]
+            rhos = all_rhos
+            if group_col == 'scenario':
+                # The scenario component is constant within a group; only inner clusters contribute
+                cluster_codes, rhos = cluster_codes[1:], rhos[1:]
+            deff = _design_effects(group_codes, cluster_codes, rhos)
+            group_y = y[labelled]
+
+            n = np.bincount(group_codes, minlength=len(groups)).astype(float)
+            sums = np.bincount(group_codes, weights=group_y, minlength=len(groups))
+            mean = sums / n
+            squares = np.bincount(group_codes, weights=(group_y - mean[group_codes]) ** 2, minlength=len(groups))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                var = np.where(n > 1, squares / (n - 1), np.nan)
+                stderr = np.sqrt(var / n)
+                t_val = stats.t.ppf((1 + confidence) / 2, df=np.where(n > 1, n - 1, np.nan))
+            margin = t_val * stderr
+            adj_margin = margin * np.sqrt(deff)
+
+            tables.append(pd.DataFrame({
+                'group_col': group_col,
+                'group': groups,
+                'metric': metric_col,
+                'level': level,
+                'mean': mean,
+                'n': n.astype(int),
+                'design_effect': deff,
+                'n_effective': n / deff,
+                'ci_lower': mean - margin,
+                'ci_upper': mean + margin,
+                'adj_ci_lower': mean - adj_margin,
+                'adj_ci_upper': mean + adj_margin,
+            }))
+
+    return pd.concat(tables, ignore_index=True)